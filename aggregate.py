@@ -0,0 +1,196 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from output import COLUMN_HEADERS
+from policy import KERNEL_FIELDS, PV_COLUMNS, Policy
+
+PV_NAMES = [column for column, name in PV_COLUMNS]
+
+class _Buckets:
+    # counts and sums of values by integer bucket key, in a dense array starting at key offset
+
+    def __init__(self):
+        self.offset = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.sums = np.zeros(0)
+
+    def _cover(self, lo, hi):
+        # grows the arrays so that keys lo, ..., hi have a slot
+        if (len(self.counts) == 0):
+            self.offset = lo
+            self.counts = np.zeros(hi - lo + 1, dtype=np.int64)
+            self.sums = np.zeros(hi - lo + 1)
+            return
+        new_lo = min(lo, self.offset)
+        new_hi = max(hi, self.offset + len(self.counts) - 1)
+        if (new_lo == self.offset and new_hi == self.offset + len(self.counts) - 1):
+            return
+        counts = np.zeros(new_hi - new_lo + 1, dtype=np.int64)
+        sums = np.zeros(new_hi - new_lo + 1)
+        counts[self.offset - new_lo:self.offset - new_lo + len(self.counts)] = self.counts
+        sums[self.offset - new_lo:self.offset - new_lo + len(self.sums)] = self.sums
+        self.offset, self.counts, self.sums = new_lo, counts, sums
+
+    def add(self, keys, values):
+        if (len(keys) == 0):
+            return
+        lo, hi = int(keys.min()), int(keys.max())
+        self._cover(lo, hi)
+        index = keys - self.offset
+        self.counts += np.bincount(index, minlength=len(self.counts))
+        self.sums += np.bincount(index, weights=values, minlength=len(self.sums))
+
+    def merge(self, other):
+        if (len(other.counts) == 0):
+            return
+        self._cover(other.offset, other.offset + len(other.counts) - 1)
+        lo = other.offset - self.offset
+        self.counts[lo:lo + len(other.counts)] += other.counts
+        self.sums[lo:lo + len(other.sums)] += other.sums
+
+class QuantileSketch:
+    # mergeable quantile sketch with relative accuracy relative_accuracy (DDSketch): every value x != 0
+    # falls in the logarithmic bucket ceil(log(|x|) / log(gamma)), gamma = (1 + a) / (1 - a), on its sign's side
+    #
+    # buckets hold counts and sums, so merging two sketches adds them up and gives the same sketch as
+    # one stream of both sets of values, and the tail expectation uses the actual values of whole buckets
+
+    def __init__(self, relative_accuracy=0.001):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.positive = _Buckets()
+        self.negative = _Buckets()
+        self.zero_count = 0
+        self.count = 0
+
+    def _keys(self, x):
+        return np.ceil(np.log(x) / self.log_gamma).astype(np.int64)
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        positive = values[values > 0.0]
+        negative = values[values < 0.0]
+        self.positive.add(self._keys(positive), positive)
+        self.negative.add(self._keys(-negative), negative)
+        self.zero_count += len(values) - len(positive) - len(negative)
+        self.count += len(values)
+
+    def merge(self, other):
+        if (other.gamma != self.gamma):
+            raise ValueError("cannot merge sketches of relative accuracy %g and %g"
+                             % (self.relative_accuracy, other.relative_accuracy))
+        self.positive.merge(other.positive)
+        self.negative.merge(other.negative)
+        self.zero_count += other.zero_count
+        self.count += other.count
+        return self
+
+    def _ordered(self):
+        # (representative value, count, sum) of every bucket from the lowest values to the highest
+        neg = self.negative
+        pos = self.positive
+        value = np.concatenate([-2 * self.gamma ** (neg.offset + np.arange(len(neg.counts)))[::-1] / (self.gamma + 1),
+                                [0.0],
+                                2 * self.gamma ** (pos.offset + np.arange(len(pos.counts))) / (self.gamma + 1)])
+        counts = np.concatenate([neg.counts[::-1], [self.zero_count], pos.counts])
+        sums = np.concatenate([neg.sums[::-1], [0.0], pos.sums])
+        return value, counts, sums
+
+    def quantile(self, q):
+        # value at rank q * (count - 1), within relative_accuracy of the exact order statistic
+        if (self.count == 0):
+            return np.nan
+        value, counts, sums = self._ordered()
+        return value[np.searchsorted(np.cumsum(counts), q * (self.count - 1), side='right')]
+
+    def tail_mean(self, q):
+        # mean of the highest (1 - q) * count values (conditional tail expectation at level q); the bucket
+        # straddling the quantile contributes its share of the tail at its own average value
+        if (self.count == 0):
+            return np.nan
+        value, counts, sums = self._ordered()
+        tail = (1 - q) * self.count
+        above = np.cumsum(counts[::-1])[::-1] - counts
+        share = np.clip(tail - above, 0, counts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            average = np.where(counts > 0, sums / counts, value)
+        return (share * average).sum() / tail
+
+class Aggregator:
+    # running statistics of batched projections, pushed one project_batch result at a time, in memory
+    # that does not grow with the number of scenarios:
+    # count, mean and variance of each PV, a QuantileSketch of each PV and per-year sums of columns
+    #
+    # partial aggregators (for example one per worker) are combined with merge: counts, sketches and
+    # year sums add up, and means and variances use the pairwise update of Chan, Golub and LeVeque,
+    # so merged partials give the same statistics as one aggregator fed every scenario
+
+    def __init__(self, columns=(), levels=(0.7, 0.95, 0.99), relative_accuracy=0.001, yrs=Policy.yrs):
+        unknown = [name for name in columns if (name not in KERNEL_FIELDS)]
+        if (len(unknown) > 0):
+            raise ValueError("unknown columns: %s" % ", ".join(unknown))
+        self.columns = list(columns)
+        self.levels = list(levels)
+        self.relative_accuracy = relative_accuracy
+        self.yrs = yrs
+        self.count = 0
+        self.mean = np.zeros(len(PV_COLUMNS))
+        self.m2 = np.zeros(len(PV_COLUMNS))
+        self.sketches = [QuantileSketch(relative_accuracy) for pv in PV_COLUMNS]
+        self.year_sums = np.zeros((len(self.columns), yrs))
+
+    def empty(self):
+        # a new aggregator with the same settings and no scenarios
+        return Aggregator(self.columns, self.levels, self.relative_accuracy, self.yrs)
+
+    def _combine(self, count, mean, m2):
+        total = self.count + count
+        if (total == 0):
+            return
+        delta = mean - self.mean
+        self.m2 = self.m2 + m2 + delta ** 2 * (self.count * count / total)
+        self.mean = self.mean + delta * (count / total)
+        self.count = total
+
+    def push(self, results):
+        # adds a dict from Policy.project_batch holding the PVs and at least self.columns
+        pv = np.column_stack([results[name] for column, name in PV_COLUMNS]).astype(float)
+        if (len(pv) == 0):
+            return
+        mean = pv.mean(axis=0)
+        self._combine(len(pv), mean, ((pv - mean) ** 2).sum(axis=0))
+        for sketch, values in zip(self.sketches, pv.T):
+            sketch.add(values)
+        for k, name in enumerate(self.columns):
+            self.year_sums[k] += results[name].sum(axis=0)
+
+    def merge(self, other):
+        if (other.columns != self.columns or other.yrs != self.yrs):
+            raise ValueError("cannot merge aggregators of different columns or yrs")
+        self._combine(other.count, other.mean, other.m2)
+        for sketch, other_sketch in zip(self.sketches, other.sketches):
+            sketch.merge(other_sketch)
+        self.year_sums = self.year_sums + other.year_sums
+        return self
+
+    def summary(self):
+        # Mean, Std_Dev and Std_Error of each PV, with VaR_<level> and CTE_<level> for every level
+        var = self.m2 / (self.count - 1) if (self.count > 1) else np.zeros(len(self.mean))
+        table = {'Mean': self.mean,
+                 'Std_Dev': np.sqrt(var),
+                 'Std_Error': np.sqrt(var / max(self.count, 1))}
+        for level in self.levels:
+            label = '%g' % (100 * level)
+            table['VaR_' + label] = [sketch.quantile(level) for sketch in self.sketches]
+            table['CTE_' + label] = [sketch.tail_mean(level) for sketch in self.sketches]
+        return pd.DataFrame(table, index=PV_NAMES, columns=list(table))
+
+    def yearly(self):
+        # average of every kept column in each year, one row per year
+        table = {'Year': np.arange(self.yrs)}
+        for k, name in enumerate(self.columns):
+            table[COLUMN_HEADERS[name]] = self.year_sums[k] / max(self.count, 1)
+        return pd.DataFrame(table)
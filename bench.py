@@ -0,0 +1,197 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from inforce import InForce
+from policy import Policy
+from runner import MonteCarloRunner
+from scenario import ScenarioGenerator
+
+# sizes of the scenario and in-force cases
+SCENARIO_COUNTS = [1000, 100000]
+POLICY_COUNTS = [1, 1000, 100000]
+
+# a case is flagged when its time or peak memory grows by more than this share of its baseline
+REGRESSION_THRESHOLD = 0.2
+
+# fast cases are timed over enough calls to take at least this many seconds
+MIN_SECONDS = 0.2
+
+RESULT_COLUMNS = ['Seconds', 'Years_Per_Second', 'Peak_MB']
+
+@contextlib.contextmanager
+def _scratch_directory():
+    # output_to_excel writes output.xlsx to the working directory, so Excel cases run in a scratch one
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as path:
+        os.chdir(path)
+        try:
+            yield path
+        finally:
+            os.chdir(cwd)
+
+def _single_path(stages):
+    # one Policy path through stages, any of 'generate', 'calculate' and 'excel'
+    policy = Policy()
+    rng = np.random.default_rng(0)
+    policy.generate_fund2_return(rng)
+    policy.calculate()
+
+    def run():
+        if ('generate' in stages):
+            policy.generate_fund2_return(rng)
+        if ('calculate' in stages):
+            policy.calculate()
+        if ('excel' in stages):
+            with _scratch_directory():
+                policy.output_to_excel()
+    return run
+
+def _scenarios(n, stage):
+    # n scenarios of the default Policy: generated ('generate'), projected from paths generated
+    # beforehand ('project'), or both through a single-process MonteCarloRunner ('run')
+    generator = ScenarioGenerator(seed=2016)
+    if (stage == 'generate'):
+        return lambda: generator.generate(n)
+    if (stage == 'project'):
+        policy = Policy()
+        fund2_return = generator.generate(n)
+        return lambda: policy.calculate_batch(fund2_return)
+    runner = MonteCarloRunner(generator=generator, max_workers=1)
+    return lambda: runner.run(n)
+
+def _policies(n):
+    # an in-force block of n contracts of varied ages, premiums and fund splits, all on one path
+    rng = np.random.default_rng(0)
+    start_age = rng.integers(45, 76, n)
+    fund1 = rng.uniform(0.05, 0.4, n)
+    inforce = InForce(pd.DataFrame({'start_age': start_age,
+                                    'initial_premium': np.round(rng.lognormal(11.5, 0.7, n), -2),
+                                    'first_wd_age': start_age + rng.integers(0, 16, n),
+                                    'annuity_start_age': np.maximum(start_age + rng.integers(5, 25, n), 80),
+                                    'fund1_pre_fee_initial': fund1,
+                                    'fund2_pre_fee_initial': 0.8 - fund1}))
+    fund2_return = ScenarioGenerator(seed=2016).generate(1)[0]
+    return lambda: inforce.project(fund2_return)
+
+def benchmarks(scenario_counts=SCENARIO_COUNTS, policy_counts=POLICY_COUNTS):
+    # name -> (setup, paths): setup builds the inputs of a case outside the timing and returns the function
+    # to time, which generates or projects paths paths of Policy.yrs years
+    cases = {'generate_fund2_return': (lambda: _single_path(['generate']), 1),
+             'calculate': (lambda: _single_path(['calculate']), 1),
+             'output_to_excel': (lambda: _single_path(['excel']), 1),
+             'single_path': (lambda: _single_path(['generate', 'calculate', 'excel']), 1)}
+    for n in scenario_counts:
+        for stage in ['generate', 'project', 'run']:
+            cases['scenarios_%d_%s' % (n, stage)] = ((lambda n=n, stage=stage: _scenarios(n, stage)), n)
+    for n in policy_counts:
+        cases['policies_%d' % n] = ((lambda n=n: _policies(n)), n)
+    return cases
+
+def measure(setup, paths, repeat=3):
+    # best time per call of repeat timings after a warm-up call (which fills the schedule cache), the years
+    # of paths handled per second at that time, and the peak memory traced by tracemalloc in a separate call;
+    # a timing covers as many calls as it takes to last MIN_SECONDS, doubling from one
+    run = setup()
+    run()
+
+    def timing(number):
+        started = time.perf_counter()
+        for k in range(number):
+            run()
+        return (time.perf_counter() - started) / number
+
+    number = 1
+    seconds = timing(number)
+    while (seconds * number < MIN_SECONDS):
+        number *= 2
+        seconds = timing(number)
+    for k in range(repeat - 1):
+        seconds = min(seconds, timing(number))
+
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return [seconds, paths * Policy.yrs / seconds, peak / 2 ** 20]
+
+def run_benchmarks(cases=None, repeat=3, only=None):
+    # table of measure for every case of cases (benchmarks() by default), one row per case;
+    # only keeps the cases whose name contains any of its strings
+    cases = benchmarks() if (cases is None) else cases
+    rows = {}
+    for name, (setup, paths) in cases.items():
+        if (only is not None and not any(part in name for part in only)):
+            continue
+        rows[name] = measure(setup, paths, repeat)
+    return pd.DataFrame.from_dict(rows, orient='index', columns=RESULT_COLUMNS)
+
+def save_baseline(results, path):
+    # writes results to path as JSON, with the versions and machine they were measured on
+    baseline = {'python': platform.python_version(),
+                'numpy': np.__version__,
+                'pandas': pd.__version__,
+                'machine': platform.platform(),
+                'results': results.to_dict(orient='index')}
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2)
+
+def load_baseline(path):
+    with open(path) as f:
+        baseline = json.load(f)
+    return pd.DataFrame.from_dict(baseline['results'], orient='index', columns=RESULT_COLUMNS)
+
+def _change(new, old):
+    # new / old - 1, and 0 where old is 0 (a baseline too small to measure a change against)
+    return (new / old.where(old > 0) - 1).fillna(0.0)
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    # the relative change in time and peak memory of every case of results that is also in baseline,
+    # with Regression set where either grew by more than threshold
+    names = [name for name in results.index if (name in baseline.index)]
+    results = results.loc[names]
+    baseline = baseline.loc[names]
+    table = pd.DataFrame({'Baseline_Seconds': baseline['Seconds'],
+                          'Seconds': results['Seconds'],
+                          'Time_Change': _change(results['Seconds'], baseline['Seconds']),
+                          'Baseline_Peak_MB': baseline['Peak_MB'],
+                          'Peak_MB': results['Peak_MB'],
+                          'Memory_Change': _change(results['Peak_MB'], baseline['Peak_MB'])})
+    table['Regression'] = (table['Time_Change'] > threshold) | (table['Memory_Change'] > threshold)
+    return table
+
+if (__name__ == "__main__"):
+    parser = argparse.ArgumentParser(description="time the stages of the model and flag regressions")
+    parser.add_argument('--quick', action='store_true', help="skip the 100,000 scenario and policy cases")
+    parser.add_argument('--only', nargs='+', help="run only the cases whose name contains one of these")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', help="write the results to this JSON baseline")
+    parser.add_argument('--compare', help="compare the results against this JSON baseline")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    if (args.quick):
+        cases = benchmarks([n for n in SCENARIO_COUNTS if (n < 100000)], [n for n in POLICY_COUNTS if (n < 100000)])
+    else:
+        cases = benchmarks()
+    results = run_benchmarks(cases, args.repeat, args.only)
+    print(results.to_string())
+    if (args.save is not None):
+        save_baseline(results, args.save)
+    if (args.compare is not None):
+        table = compare(results, load_baseline(args.compare), args.threshold)
+        print(table.to_string())
+        if (table['Regression'].any()):
+            print("regressions: %s" % ", ".join(table.index[table['Regression']]))
+            sys.exit(1)
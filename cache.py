@@ -0,0 +1,220 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import socket
+import time
+import uuid
+import zipfile
+
+import numpy as np
+
+from inforce import PER_POLICY
+from policy import Policy
+
+# Policy attributes that calculate and the batched projections read, besides the fund path; volatility
+# only shapes the fund paths, which the scenario set already identifies
+INPUT_PARAMS = [name for name in PER_POLICY if (name != 'volatility')] + ['yrs', 'precision', 'contribution']
+
+def _source_hash(cls):
+    # hash of the source file of cls
+    with open(inspect.getsourcefile(cls), 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+# the projection code the cached results come from: any change to policy.py starts a new set of keys
+MODEL_VERSION = _source_hash(Policy)
+
+@functools.lru_cache(maxsize=None)
+def _class_version(cls):
+    # hashes of the source files of the subclasses of Policy between cls and Policy, such as inforce.py
+    # for InForce and multifund.py for MultiFundPolicy, whose projections override those of policy.py
+    return [_source_hash(base) for base in cls.__mro__ if (base is not Policy and issubclass(base, Policy))]
+
+DEFAULT_MAX_BYTES = 1 << 30
+
+# a temporary file this many seconds old is left over from a writer that crashed, and evict removes it
+STALE_TEMPORARY_SECONDS = 3600
+
+def _digest(value):
+    # a JSON-able fingerprint of a parameter: scalars as they are, arrays by dtype, shape and content
+    if (isinstance(value, np.ndarray)):
+        value = np.ascontiguousarray(value)
+        return [value.dtype.str, list(value.shape), hashlib.sha256(value.tobytes()).hexdigest()]
+    if (isinstance(value, np.generic)):
+        return value.item()
+    return value
+
+def _inputs(policy):
+    # INPUT_PARAMS and the data attributes that subclasses of Policy add, such as the funds of MultiFundPolicy
+    names = list(INPUT_PARAMS)
+    for cls in type(policy).__mro__:
+        if (cls is Policy):
+            break
+        names += [name for name, value in vars(cls).items()
+                  if (not name.startswith('_') and not callable(value) and not isinstance(value, (classmethod, staticmethod)))]
+    return names
+
+def scenario_id(fund2_return):
+    # identity of a scenario set taken from its content
+    return 'sha256:' + _digest(np.asarray(fund2_return, dtype=float))[2]
+
+class ResultCache:
+    # on-disk cache of projection results, shared by every process that opens the same directory
+    #
+    # an entry is keyed by a hash of the contract (its class and every attribute of INPUT_PARAMS, per-policy
+    # arrays included), the scenario set (scenario_id of the fund paths unless a name is given), the kind of
+    # projection and its kept columns, MODEL_VERSION and the source of its class if that is a subclass of
+    # Policy; it holds the PVs and, if asked for, the per-year arrays, as one npz file named by the key
+    #
+    # files are written to a temporary name and renamed into place, so readers in other processes see
+    # a whole entry or none; once the files add up to more than max_bytes, the least recently used are
+    # removed (a hit touches its file), and a file removed under a reader is counted as a miss; temporary
+    # files left by crashed writers are removed after STALE_TEMPORARY_SECONDS, and an entry that cannot be
+    # read (truncated or corrupt) is removed and counted as a miss
+    #
+    # hits, misses, writes and evictions count the calls of this ResultCache, see stats
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, model_version=MODEL_VERSION):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.model_version = model_version
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def key(self, policy, scenarios, kind, columns=()):
+        # hex key of the results of kind ('calculate' or 'project_batch') of policy on scenarios
+        content = {'model': self.model_version,
+                   'class_version': _class_version(type(policy)),
+                   'kind': kind,
+                   'class': type(policy).__module__ + '.' + type(policy).__qualname__,
+                   'params': {name: _digest(getattr(policy, name)) for name in _inputs(policy)},
+                   'scenarios': scenarios,
+                   'columns': sorted(columns)}
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def get(self, key, required=()):
+        # dict of the arrays stored under key, or None when there is no entry or it lacks any of required
+        path = self.path(key)
+        try:
+            with np.load(path) as entry:
+                arrays = dict(entry)
+            os.utime(path)
+        except (FileNotFoundError, PermissionError):
+            arrays = None
+        except (zipfile.BadZipFile, EOFError, ValueError, OSError):
+            arrays = None
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if (arrays is None or any(name not in arrays for name in required)):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return arrays
+
+    def put(self, key, arrays):
+        path = self.path(key)
+        temporary = '%s.%s.%d.%s.tmp' % (path, socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        try:
+            with open(temporary, 'xb') as f:
+                np.savez(f, **arrays)
+            os.replace(temporary, path)
+        finally:
+            if (os.path.exists(temporary)):
+                os.remove(temporary)
+        self.writes += 1
+        self.evict()
+
+    def entries(self):
+        # (last use, size, path) of every entry, least recently used first
+        found = []
+        for entry in os.scandir(self.directory):
+            if (entry.name.endswith('.npz')):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                found.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(found)
+
+    def evict(self):
+        # removes the least recently used entries until the cache holds at most max_bytes, and temporary
+        # files older than STALE_TEMPORARY_SECONDS
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if (entry.name.endswith('.tmp')):
+                try:
+                    if (now - entry.stat().st_mtime > STALE_TEMPORARY_SECONDS):
+                        os.remove(entry.path)
+                except (FileNotFoundError, PermissionError):
+                    pass
+
+        found = self.entries()
+        total = sum(size for used, size, path in found)
+        for used, size, path in found:
+            if (total <= self.max_bytes):
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except (FileNotFoundError, PermissionError):
+                pass
+            total -= size
+
+    def clear(self):
+        for used, size, path in self.entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        found = self.entries()
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if (lookups > 0) else 0.0,
+                'writes': self.writes,
+                'evictions': self.evictions,
+                'entries': len(found),
+                'bytes': sum(size for used, size, path in found)}
+
+    def calculate(self, policy, cashflows=False, scenarios=None):
+        # policy.calculate(), unless its results on policy.fund2_return are cached: the PVs are then
+        # restored, and with cashflows the per-year arrays as well (an entry stored without them is a miss)
+        scenarios = scenario_id(policy.fund2_return) if (scenarios is None) else scenarios
+        key = self.key(policy, scenarios, 'calculate')
+        arrays = self.get(key, ['values', 'flags'] if (cashflows) else [])
+        if (arrays is not None):
+            policy.pv_db_claim, policy.pv_wb_claim, policy.pv_rc = arrays['pv'].tolist()
+            if (cashflows):
+                policy.values[:] = arrays['values']
+                policy.flags[:] = arrays['flags']
+            return policy
+
+        policy.calculate()
+        arrays = {'pv': np.array([policy.pv_db_claim, policy.pv_wb_claim, policy.pv_rc])}
+        if (cashflows):
+            arrays['values'] = policy.values
+            arrays['flags'] = policy.flags
+        self.put(key, arrays)
+        return policy
+
+    def project_batch(self, policy, fund2_return, columns=(), scenarios=None):
+        # policy.project_batch(fund2_return, columns), from the cache when it holds the result; scenarios
+        # names the scenario set (for example a generator seed and range) instead of hashing fund2_return
+        scenarios = scenario_id(fund2_return) if (scenarios is None) else scenarios
+        key = self.key(policy, scenarios, 'project_batch', columns)
+        results = self.get(key)
+        if (results is None):
+            results = policy.project_batch(fund2_return, columns)
+            self.put(key, results)
+        return results
@@ -0,0 +1,157 @@
+import heapq
+
+import numpy as np
+import pandas as pd
+
+from inforce import InForce, PER_POLICY
+from policy import PV_COLUMNS
+
+PV_NAMES = [column for column, name in PV_COLUMNS]
+
+# age columns clustered as the years from another column of the contract rather than as ages: the
+# claims turn on how long the account grows before withdrawals start and how long they last
+AGE_OFFSETS = {'first_wd_age': 'start_age', 'annuity_start_age': 'first_wd_age'}
+
+# scale of clustering columns relative to the others once standardized: the deferral to first
+# withdrawal moves the withdrawal benefit claims the most
+COLUMN_SCALE = {'first_wd_age': 3.0}
+
+# every amount of the projection is proportional to initial_premium, so the premium is the weight of
+# a contract in its cluster rather than a clustering attribute: a representative with the cluster's
+# average premium and premium-weighted average terms stands for all of them
+
+def _bisect(x, weight, n_points, clusters):
+    # cluster of every row of x, starting from clusters (arrays of row positions): the cluster with the largest
+    # weighted sum of squared deviations is split at its weighted mean along its widest column, until there
+    # are n_points clusters or none can be split
+    def entry(k):
+        # (-spread, k, widest column, weighted mean) of cluster k, the heap's largest spread first
+        rows = clusters[k]
+        w = weight[rows]
+        mean = w @ x[rows] / w.sum()
+        spread = w @ (x[rows] - mean) ** 2
+        return (-spread.sum(), k, int(np.argmax(spread)), mean)
+
+    clusters = list(clusters)
+    heap = [entry(k) for k in range(len(clusters))]
+    while (len(clusters) < n_points and len(heap) > 0):
+        sse, k, column, mean = heapq.heappop(heap)
+        if (sse == 0.0):
+            break
+        rows = clusters[k]
+        low = x[rows, column] <= mean[column]
+        if (low.all() or not low.any()):
+            continue
+        clusters[k] = rows[low]
+        clusters.append(rows[~low])
+        heapq.heappush(heap, entry(k))
+        heapq.heappush(heap, entry(len(clusters) - 1))
+
+    label = np.empty(len(x), dtype=int)
+    for k, rows in enumerate(clusters):
+        label[rows] = k
+    return label
+
+class ModelPoints:
+    # an in-force block compressed to about n_points representative contracts (model points)
+    #
+    # contracts are clustered on columns (by default every per-policy column of the in-force table but
+    # initial_premium and policy_id), the ages of AGE_OFFSETS taken as years from their base column,
+    # each standardized to unit spread over the block and multiplied by its scale (COLUMN_SCALE by default);
+    # contracts that differ in any column of exact never share a model point; a model point has
+    # the premium-weighted average of its cluster's columns, rounded for columns holding whole numbers
+    # only (ages), and the cluster's average premium, and weight is the number of contracts it stands for
+    #
+    # points is the InForce of the model points, label the model point of every contract of inforce
+
+    def __init__(self, inforce, n_points, columns=None, scale=None, exact=()):
+        table = inforce.table
+        if (columns is None):
+            columns = [name for name in table.columns if (name in PER_POLICY and name != 'initial_premium')]
+        unknown = [name for name in columns if (name not in table.columns)]
+        if (len(unknown) > 0):
+            raise ValueError("columns not in the in-force table: %s" % ", ".join(unknown))
+        self.inforce = inforce
+        self.columns = list(columns)
+
+        scale = COLUMN_SCALE if (scale is None) else scale
+        values = table[self.columns].to_numpy(dtype=float)
+        for k, name in enumerate(self.columns):
+            if (name in AGE_OFFSETS and AGE_OFFSETS[name] in table.columns):
+                values[:, k] -= table[AGE_OFFSETS[name]].to_numpy(dtype=float)
+        spread = values.std(axis=0)
+        x = (values - values.mean(axis=0)) / np.where(spread > 0.0, spread, 1.0)
+        x *= np.array([scale.get(name, 1.0) for name in self.columns])
+        self.premium = np.broadcast_to(np.asarray(inforce.initial_premium, dtype=float), (len(inforce),))
+        if (len(exact) > 0):
+            groups = list(table.groupby(list(exact), sort=False).indices.values())
+        else:
+            groups = [np.arange(len(table))]
+        self.label = _bisect(x, self.premium, n_points, groups)
+
+        n = self.label.max() + 1
+        self.weight = np.bincount(self.label, minlength=n).astype(float)
+        cluster_premium = np.bincount(self.label, weights=self.premium, minlength=n)
+        points = {}
+        for name in table.columns:
+            if (name == 'policy_id' or name == 'initial_premium'):
+                continue
+            column = table[name].to_numpy(dtype=float)
+            average = np.bincount(self.label, weights=self.premium * column, minlength=n) / cluster_premium
+            points[name] = np.round(average) if (np.all(column == np.round(column))) else average
+        points['initial_premium'] = cluster_premium / self.weight
+        self.points = InForce(pd.DataFrame(points))
+
+    def __len__(self):
+        return len(self.weight)
+
+    def stand_in(self, index):
+        # weight of every model point in standing for the contracts at positions index of the block:
+        # each contract counts as its premium over its model point's premium
+        scale = self.premium[index] / self.points.initial_premium[self.label[index]]
+        return np.bincount(self.label[index], weights=scale, minlength=len(self))
+
+def block_pvs(inforce, fund2_return, weight=None, chunk_size=50000):
+    # total pv_db_claim, pv_wb_claim and pv_rc of the contracts of inforce, each counted weight times,
+    # under every scenario of fund2_return (shape (n_scenarios, yrs)), shape (n_scenarios, len(PV_COLUMNS))
+    #
+    # a batch holds about chunk_size (contract, scenario) rows: all contracts under several scenarios,
+    # or slices of the contracts under one
+    weight = np.ones(len(inforce)) if (weight is None) else np.asarray(weight, dtype=float)
+    n_contracts = min(len(inforce), chunk_size)
+    per_batch = max(1, chunk_size // len(inforce))
+    totals = np.zeros((fund2_return.shape[0], len(PV_COLUMNS)))
+    for lo in range(0, len(inforce), n_contracts):
+        hi = min(lo + n_contracts, len(inforce))
+        for s in range(0, fund2_return.shape[0], per_batch):
+            m = min(per_batch, fund2_return.shape[0] - s)
+            contracts = inforce.subset(np.tile(np.arange(lo, hi), m))
+            pv = np.column_stack(contracts.calculate_batch(np.repeat(fund2_return[s:s + m], hi - lo, axis=0)))
+            totals[s:s + m] += np.einsum('mcp,c->mp', pv.reshape(m, hi - lo, -1), weight[lo:hi])
+    return totals
+
+def compression_report(model_points, fund2_return, sample=None, seed=0, chunk_size=50000):
+    # error of model_points against a seriatim run of the block, on the scenarios of fund2_return
+    #
+    # with sample, the seriatim run covers only that many contracts drawn at random, and the model points
+    # stand in for just those (ModelPoints.stand_in); returns, for each PV, the mean block totals of both
+    # runs, the relative error of the mean and the largest error in any one scenario relative to the mean
+    inforce = model_points.inforce
+    if (sample is None or sample >= len(inforce)):
+        index = np.arange(len(inforce))
+        contracts = inforce
+    else:
+        index = np.sort(np.random.default_rng(seed).choice(len(inforce), sample, replace=False))
+        contracts = inforce.subset(index)
+    seriatim = block_pvs(contracts, fund2_return, chunk_size=chunk_size)
+    weight = model_points.stand_in(index)
+    used = np.flatnonzero(weight)
+    compressed = block_pvs(model_points.points.subset(used), fund2_return, weight[used], chunk_size)
+
+    mean = seriatim.mean(axis=0)
+    return pd.DataFrame({'Seriatim': mean,
+                         'Compressed': compressed.mean(axis=0),
+                         'Rel_Error': (compressed.mean(axis=0) - mean) / np.abs(mean),
+                         'Max_Scenario_Error': np.abs(compressed - seriatim).max(axis=0) / np.abs(mean)},
+                        index=PV_NAMES,
+                        columns=['Seriatim', 'Compressed', 'Rel_Error', 'Max_Scenario_Error'])
@@ -0,0 +1,63 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+from policy import PV_COLUMNS, Policy
+from scenario import ScenarioGenerator, lognormal_returns
+
+BUMPS = ['base', 'delta_up', 'delta_down', 'vega_up', 'vega_down', 'rho_up', 'rho_down']
+
+def _bumped_pvs(policy, z, delta_bump, rate_bump, vol_bump):
+    # summed PVs of one chunk of shocks z under every bump in BUMPS, shape (len(BUMPS), len(PV_COLUMNS))
+    #
+    # the fund level and volatility bumps share the contract's risk_free_rate, so they run as one batch
+    # on its cached schedule, with the fund level moved through the initial fund allocation rows;
+    # each rate bump gets its own batch and schedule, as df and fund1_return move with the rate
+    n = z.shape[0]
+    rate = policy.risk_free_rate
+    vol = policy.volatility
+    base = lognormal_returns(z, rate, vol)
+    fund_level = np.repeat([1.0, 1.0 + delta_bump, 1.0 - delta_bump, 1.0, 1.0], n)
+
+    same_rate = copy.copy(policy)
+    same_rate.fund1_pre_fee_initial = policy.fund1_pre_fee_initial * fund_level
+    same_rate.fund2_pre_fee_initial = policy.fund2_pre_fee_initial * fund_level
+    batches = [(same_rate, np.vstack([base, base, base,
+                                      lognormal_returns(z, rate, vol + vol_bump),
+                                      lognormal_returns(z, rate, vol - vol_bump)]))]
+    for bumped_rate in [rate + rate_bump, rate - rate_bump]:
+        moved = copy.copy(policy)
+        moved.risk_free_rate = bumped_rate
+        batches.append((moved, lognormal_returns(z, bumped_rate, vol)))
+
+    sums = []
+    for contract, fund2_return in batches:
+        results = contract.project_batch(fund2_return)
+        pv = np.column_stack([results[name] for column, name in PV_COLUMNS])
+        sums.append(pv.reshape(-1, n, len(PV_COLUMNS)).sum(axis=1))
+    return np.vstack(sums)
+
+def greeks(n_scenarios, policy=None, generator=None, chunk_size=10000,
+           delta_bump=0.01, rate_bump=0.0001, vol_bump=0.01):
+    # PVs and their sensitivities by central bump-and-revalue on common random numbers:
+    # Delta per unit of initial account value, Rho per unit of risk_free_rate, Vega per unit of volatility
+    #
+    # the standard normal shocks are drawn once per chunk and every bump re-derives its lognormal
+    # fund2_return paths from them, so the differences carry no fresh sampling noise
+    policy = Policy() if (policy is None) else policy
+    generator = ScenarioGenerator() if (generator is None) else generator
+
+    sums = 0
+    for lo in range(0, n_scenarios, chunk_size):
+        hi = min(lo + chunk_size, n_scenarios)
+        sums = sums + _bumped_pvs(policy, generator.normals(lo, hi), delta_bump, rate_bump, vol_bump)
+    pv = dict(zip(BUMPS, sums / n_scenarios))
+
+    av = policy.initial_premium * (policy.fund1_pre_fee_initial + policy.fund2_pre_fee_initial)
+    return pd.DataFrame({'Value': pv['base'],
+                         'Delta': (pv['delta_up'] - pv['delta_down']) / (2 * delta_bump * av),
+                         'Rho': (pv['rho_up'] - pv['rho_down']) / (2 * rate_bump),
+                         'Vega': (pv['vega_up'] - pv['vega_down']) / (2 * vol_bump)},
+                        index=[column for column, name in PV_COLUMNS],
+                        columns=['Value', 'Delta', 'Rho', 'Vega'])
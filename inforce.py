@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from policy import Policy
+
+# Policy class attributes that may differ from one contract to the next
+PER_POLICY = [name for name, value in vars(Policy).items()
+              if (isinstance(value, (int, float)) and name != 'yrs')]
+
+class InForce(Policy):
+    # a block of contracts valued in one call, stored as a struct of arrays
+    #
+    # the in-force table has one row per contract, an optional policy_id column and one column per
+    # Policy class attribute that differs between contracts (initial_premium, start_age, first_wd_age,
+    # annuity_start_age, rider_charge_rate, fund1_pre_fee_initial, fund2_pre_fee_initial, ...);
+    # attributes without a column keep the Policy value for every contract
+
+    def __init__(self, table):
+        unknown = [name for name in table.columns if (name != 'policy_id' and name not in PER_POLICY)]
+        if (len(unknown) > 0):
+            raise ValueError("unknown in-force columns: %s" % ", ".join(unknown))
+
+        self.table = table.reset_index(drop=True)
+        if ('policy_id' in self.table.columns):
+            self.policy_id = self.table['policy_id'].to_numpy()
+        else:
+            self.policy_id = np.arange(len(self.table))
+        for name in self.table.columns:
+            if (name != 'policy_id'):
+                setattr(self, name, self.table[name].to_numpy(dtype=float))
+
+        # age, qx and the other schedules are built in bulk by self.schedule(), one row per contract
+        self.contribution = np.zeros(self.yrs)
+
+    @classmethod
+    def from_csv(cls, path):
+        return cls(pd.read_csv(path))
+
+    def __len__(self):
+        return len(self.policy_id)
+
+    def subset(self, index):
+        # the contracts at positions index, as a new InForce
+        return InForce(self.table.iloc[index])
+
+    def project(self, fund2_return, chunk_size=50000):
+        # fund2_return is either one path shared by every contract, shape (yrs,),
+        # or one path per contract, shape (len(self), yrs)
+        # returns per-policy pv_db_claim, pv_wb_claim and pv_rc arrays
+        fund2_return = np.broadcast_to(fund2_return, (len(self), self.yrs))
+        if (len(self) <= chunk_size):
+            return self.calculate_batch(fund2_return)
+        pv = [self.subset(slice(lo, lo + chunk_size)).calculate_batch(fund2_return[lo:lo + chunk_size])
+              for lo in range(0, len(self), chunk_size)]
+        return tuple(np.concatenate(x) for x in zip(*pv))
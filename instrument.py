@@ -0,0 +1,68 @@
+import json
+import time
+
+class Instrumentation:
+    # named stage timers and counters filled by Policy.calculate, Policy.project_funds (and so every
+    # batched projection) and Policy.output_to_excel once set as the instrumentation of a Policy, e.g.
+    #     Policy.instrumentation = Instrumentation()
+    #
+    # a projection calls start, then lap(stage) at the end of each of its stages, which adds the time
+    # since the previous start or lap to stage; stages that come back within a year (such as 'account')
+    # add up over the year and over all years
+    #
+    # callback, if given, is called as callback(event, instrumentation) at the end of every projection
+    # ('calculate' or 'project_funds') and Excel output ('output_to_excel'), to feed a monitoring system
+    #
+    # an Instrumentation belongs to one process: MonteCarloRunner workers fill their own copies
+
+    def __init__(self, callback=None, clock=time.perf_counter):
+        self.callback = callback
+        self.clock = clock
+        self.reset()
+
+    def reset(self):
+        self.seconds = {}
+        self.calls = {}
+        self.counters = {}
+        self._mark = self.clock()
+
+    def start(self):
+        self._mark = self.clock()
+
+    def lap(self, stage):
+        now = self.clock()
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + (now - self._mark)
+        self.calls[stage] = self.calls.get(stage, 0) + 1
+        self._mark = now
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    def finish(self, event):
+        if (self.callback is not None):
+            self.callback(event, self)
+
+    def as_dict(self):
+        return {'stages': {stage: {'seconds': self.seconds[stage], 'calls': self.calls[stage]} for stage in self.seconds},
+                'counters': dict(self.counters)}
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.as_dict(), **kwargs)
+
+class NullInstrumentation:
+    # the default instrumentation of Policy: every call does nothing, so a projection pays only for
+    # a few method calls per year
+
+    def start(self):
+        pass
+
+    def lap(self, stage):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def finish(self, event):
+        pass
+
+NO_INSTRUMENTATION = NullInstrumentation()
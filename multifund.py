@@ -0,0 +1,27 @@
+import numpy as np
+
+from policy import Policy
+
+class MultiFundPolicy(Policy):
+    # a Policy whose account is spread over any number of funds, valued in batches by Policy.project_funds
+    # on the (n_scenarios, n_funds, yrs) fund return paths of a MultiFundGenerator
+    #
+    # fund_pre_fee_initial is the share of initial_premium put in each fund and rb_weights the share of
+    # each fund after a rebalance; the defaults are the two funds of Policy, so with a MultiFundGenerator
+    # of volatility [0.0, Policy.volatility] it values the same contract
+    #
+    # only the batched projection knows about the funds: calculate and output_to_excel are the
+    # single-path, two-fund projection of Policy
+
+    fund_pre_fee_initial = [Policy.fund1_pre_fee_initial, Policy.fund2_pre_fee_initial]
+    rb_weights = [Policy.rb_target, 1 - Policy.rb_target]
+
+    def project_batch(self, fund_return, columns=()):
+        # calculate_batch of fund_return, shape (n_scenarios, n_funds, yrs), also keeping the per-year
+        # arrays named in columns (any of ACCOUNT_FIELDS or FUND_FIELDS)
+        # returns a dict of pv_db_claim, pv_wb_claim, pv_rc and the kept columns
+        fund_return = np.asarray(fund_return)
+        if (fund_return.ndim != 3 or fund_return.shape[1] != len(self.fund_pre_fee_initial)):
+            raise ValueError("fund_return must have shape (n_scenarios, %d, %d)"
+                             % (len(self.fund_pre_fee_initial), self.yrs))
+        return self.project_funds(np.swapaxes(fund_return, 0, 1), self.fund_pre_fee_initial, self.rb_weights, columns)
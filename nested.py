@@ -0,0 +1,152 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from policy import PV_COLUMNS, STATE_FIELDS, Policy
+from scenario import ScenarioGenerator
+
+PV_NAMES = [column for column, name in PV_COLUMNS]
+
+# the values of a year that Policy.project_batch resumes from, with the two funds of Policy
+NODE_FIELDS = ['fund1_post_rb', 'fund2_post_rb'] + STATE_FIELDS[1:]
+
+# drift of the default real-world outer paths over risk_free_rate
+EQUITY_RISK_PREMIUM = 0.04
+
+def _generators(policy, outer, inner):
+    # outer paths drift at risk_free_rate + EQUITY_RISK_PREMIUM, inner paths at risk_free_rate
+    if (outer is None):
+        outer = ScenarioGenerator(risk_free_rate=policy.risk_free_rate + EQUITY_RISK_PREMIUM,
+                                  volatility=policy.volatility, yrs=policy.yrs)
+    if (inner is None):
+        inner = ScenarioGenerator(risk_free_rate=policy.risk_free_rate, volatility=policy.volatility, yrs=policy.yrs)
+    return outer, inner
+
+def outer_states(policy, fund2_return):
+    # NODE_FIELDS arrays of every year of the outer paths fund2_return, shape (n_outer, yrs) each
+    return policy.project_batch(fund2_return, NODE_FIELDS)
+
+def node_state(states, year):
+    # the state of every outer path at year, one value per path
+    return {name: states[name][:, year] for name in NODE_FIELDS}
+
+def inner_values(policy, state, year, fund2_return):
+    # risk-neutral value at year of each node of state: the mean over its inner paths of pv_db_claim,
+    # pv_wb_claim and pv_rc of the years after year, discounted to year, shape (n_nodes, len(PV_COLUMNS))
+    #
+    # fund2_return holds n_inner consecutive inner paths per node, shape (n_nodes * n_inner, yrs);
+    # only its years after year are used
+    n_nodes = len(state['wd_base'])
+    n_inner = fund2_return.shape[0] // n_nodes
+    results = policy.project_batch(fund2_return, start=year,
+                                   state={name: np.repeat(state[name], n_inner) for name in NODE_FIELDS})
+    pv = np.column_stack([results[name] for column, name in PV_COLUMNS])
+    return pv.reshape(n_nodes, n_inner, -1).mean(axis=1) / policy.schedule().df[year]
+
+def _table(values, years, start=0):
+    # one row per (outer path, year) node, values of shape (n_outer, len(years), len(PV_COLUMNS))
+    n_outer = values.shape[0]
+    table = {'Path': np.repeat(np.arange(start, start + n_outer), len(years)),
+             'Year': np.tile(years, n_outer)}
+    table.update(zip(PV_NAMES, values.reshape(-1, len(PV_NAMES)).T))
+    return pd.DataFrame(table)
+
+def nested_values(n_outer, n_inner, years, policy=None, outer=None, inner=None, chunk_size=100000):
+    # exact nested valuation: the risk-neutral value of pv_db_claim, pv_wb_claim and pv_rc at every year of
+    # years on each of n_outer real-world outer paths, as the mean over n_inner inner paths from its state
+    #
+    # outer and inner are the generators of the outer and inner paths; the inner paths of outer path p
+    # are scenarios p * n_inner, ..., (p + 1) * n_inner - 1 of inner, the same for all its years, and
+    # the nodes are valued in batched projections of about chunk_size inner paths
+    policy = Policy() if (policy is None) else policy
+    outer, inner = _generators(policy, outer, inner)
+    years = list(years)
+
+    paths_per_chunk = max(1, chunk_size // n_inner)
+    values = []
+    for lo in range(0, n_outer, paths_per_chunk):
+        hi = min(lo + paths_per_chunk, n_outer)
+        states = outer_states(policy, outer.generate(hi - lo, lo))
+        fund2_return = inner.generate((hi - lo) * n_inner, lo * n_inner)
+        values.append(np.stack([inner_values(policy, node_state(states, year), year, fund2_return)
+                                for year in years], axis=1))
+    return _table(np.concatenate(values), years)
+
+class RegressionProxy:
+    # least-squares Monte Carlo proxy of nested_values: for every year, a least-squares fit of node values
+    # on functions of the node state, so that nodes valued on only a few inner paths each, whose noise
+    # averages out in the fit, stand in for a full inner simulation
+    #
+    # the basis holds every monomial of degree up to degree in the account value, the withdrawal base and
+    # the death benefit base (the larger of death_benefit_base and rop_death_base), per unit of
+    # initial_premium, and the moneyness log(1 + account value / withdrawal base) of the withdrawal
+    # guarantee, once on their own and once times each of wd_phase and auto_periodic_benefit_status
+
+    def __init__(self, degree=3, initial_premium=Policy.initial_premium):
+        self.degree = degree
+        self.initial_premium = initial_premium
+        self.coefficients = {}
+
+    def basis(self, state):
+        av = np.asarray(state['av_post_death_claim'], dtype=float)
+        wd_base = np.asarray(state['wd_base'], dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            moneyness = np.where(wd_base > 0.0, np.log1p(av / wd_base), 0.0)
+        x = np.column_stack([av / self.initial_premium, wd_base / self.initial_premium,
+                             np.maximum(state['death_benefit_base'], state['rop_death_base']) / self.initial_premium,
+                             moneyness])
+        terms = [np.ones(len(x))]
+        for degree in range(1, self.degree + 1):
+            for powers in itertools.combinations_with_replacement(range(x.shape[1]), degree):
+                terms.append(np.prod(x[:, powers], axis=1))
+        poly = np.column_stack(terms)
+        return np.hstack([poly,
+                          poly * np.asarray(state['wd_phase'])[:, np.newaxis],
+                          poly * np.asarray(state['auto_periodic_benefit_status'])[:, np.newaxis]])
+
+    def fit(self, state, year, values):
+        # fits the proxy of year on nodes of state and their values, shape (n_nodes, len(PV_COLUMNS))
+        self.coefficients[year] = np.linalg.lstsq(self.basis(state), values, rcond=None)[0]
+        return self
+
+    def predict(self, state, year):
+        # proxy values of the nodes of state at year, shape (n_nodes, len(PV_COLUMNS))
+        if (year not in self.coefficients):
+            raise KeyError("the proxy has not been fitted for year %d" % year)
+        return self.basis(state) @ self.coefficients[year]
+
+def fit_proxy(n_fit, years, n_inner=2, degree=3, policy=None, outer=None, inner=None, chunk_size=100000):
+    # RegressionProxy of every year of years, fitted on the nodes of n_fit outer paths valued on n_inner
+    # inner paths each, drawn as in nested_values
+    policy = Policy() if (policy is None) else policy
+    outer, inner = _generators(policy, outer, inner)
+    years = list(years)
+
+    paths_per_chunk = max(1, chunk_size // n_inner)
+    states, values = [], []
+    for lo in range(0, n_fit, paths_per_chunk):
+        hi = min(lo + paths_per_chunk, n_fit)
+        chunk_states = outer_states(policy, outer.generate(hi - lo, lo))
+        fund2_return = inner.generate((hi - lo) * n_inner, lo * n_inner)
+        states.append([node_state(chunk_states, year) for year in years])
+        values.append([inner_values(policy, state, year, fund2_return) for state, year in zip(states[-1], years)])
+
+    proxy = RegressionProxy(degree, policy.initial_premium)
+    for k, year in enumerate(years):
+        state = {name: np.concatenate([chunk[k][name] for chunk in states]) for name in NODE_FIELDS}
+        proxy.fit(state, year, np.vstack([chunk[k] for chunk in values]))
+    return proxy
+
+def proxy_values(n_outer, years, proxy, policy=None, outer=None, start=0, chunk_size=100000):
+    # nested_values of outer paths start, ..., start + n_outer - 1 from proxy, without inner paths
+    policy = Policy() if (policy is None) else policy
+    outer = _generators(policy, outer, None)[0]
+    years = list(years)
+
+    values = []
+    for lo in range(start, start + n_outer, chunk_size):
+        hi = min(lo + chunk_size, start + n_outer)
+        states = outer_states(policy, outer.generate(hi - lo, lo))
+        values.append(np.stack([proxy.predict(node_state(states, year), year) for year in years], axis=1))
+    return _table(np.concatenate(values), years, start)
@@ -0,0 +1,111 @@
+import abc
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from policy import CASHFLOW_COLUMNS, KERNEL_FIELDS, PV_COLUMNS
+
+# Policy attribute -> column header, as in output_to_excel
+COLUMN_HEADERS = {name: column for column, name in CASHFLOW_COLUMNS}
+
+class ResultWriter(abc.ABC):
+    # streams the results of batched projections (dicts from Policy.project_batch) into the directory path,
+    # one chunk of scenarios at a time
+    #
+    # each chunk adds one row per scenario to the PV table and, when columns names any of KERNEL_FIELDS,
+    # one row per scenario and year to the cash flow table; columns=() writes the PVs only
+
+    def __init__(self, path, columns=()):
+        unknown = [name for name in columns if (name not in KERNEL_FIELDS)]
+        if (len(unknown) > 0):
+            raise ValueError("unknown columns: %s" % ", ".join(unknown))
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.columns = list(columns)
+
+    def pv_table(self, start, results):
+        n = len(results['pv_db_claim'])
+        table = {'Scenario': np.arange(start, start + n)}
+        for column, name in PV_COLUMNS:
+            table[column] = results[name]
+        return pd.DataFrame(table)
+
+    def cashflow_table(self, start, results):
+        n, yrs = results[self.columns[0]].shape
+        table = {'Scenario': np.repeat(np.arange(start, start + n), yrs),
+                 'Year': np.tile(np.arange(yrs), n)}
+        for name in self.columns:
+            table[COLUMN_HEADERS[name]] = results[name].ravel()
+        return pd.DataFrame(table)
+
+    @abc.abstractmethod
+    def write(self, start, results):
+        # results of scenarios start, start + 1, ...
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class CsvWriter(ResultWriter):
+    # pv.csv and cashflow.csv, appended to chunk by chunk
+
+    def __init__(self, path, columns=()):
+        ResultWriter.__init__(self, path, columns)
+        self.header = True
+
+    def write(self, start, results):
+        mode = 'w' if self.header else 'a'
+        self.pv_table(start, results).to_csv(os.path.join(self.path, 'pv.csv'),
+                                             mode=mode, header=self.header, index=False)
+        if (len(self.columns) > 0):
+            self.cashflow_table(start, results).to_csv(os.path.join(self.path, 'cashflow.csv'),
+                                                       mode=mode, header=self.header, index=False)
+        self.header = False
+
+class ParquetWriter(ResultWriter):
+    # pv.parquet and cashflow.parquet, one row group per chunk; needs pyarrow
+
+    def __init__(self, path, columns=()):
+        if (pyarrow is None):
+            raise ImportError("ParquetWriter needs pyarrow")
+        ResultWriter.__init__(self, path, columns)
+        self.writers = {}
+
+    def _write_table(self, name, table):
+        table = pyarrow.Table.from_pandas(table, preserve_index=False)
+        if (name not in self.writers):
+            self.writers[name] = pyarrow.parquet.ParquetWriter(os.path.join(self.path, name + '.parquet'), table.schema)
+        self.writers[name].write_table(table)
+
+    def write(self, start, results):
+        self._write_table('pv', self.pv_table(start, results))
+        if (len(self.columns) > 0):
+            self._write_table('cashflow', self.cashflow_table(start, results))
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+class NpzWriter(ResultWriter):
+    # one chunk_<first scenario>.npz per chunk holding scenario, the PVs and the kept columns,
+    # the latter as (n_scenarios, yrs) arrays
+
+    def write(self, start, results):
+        arrays = {'scenario': np.arange(start, start + len(results['pv_db_claim']))}
+        for name in [name for column, name in PV_COLUMNS] + self.columns:
+            arrays[name] = results[name]
+        np.savez(os.path.join(self.path, 'chunk_%09d.npz' % start), **arrays)
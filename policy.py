@@ -1,7 +1,403 @@
+import functools
+import itertools
+
 import numpy as np
 import datetime as dt
 import pandas as pd
 
+from instrument import NO_INSTRUMENTATION
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+def _pro_rata(part, new_total, old_total):
+    # part * (new_total / old_total), or 0.0 wherever new_total is 0.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(new_total == 0.0, 0.0, part * (new_total / old_total))
+
+def _total(funds):
+    # sum of a list of per-fund arrays, added up in fund order, or 0.0 for no funds
+    return sum(funds[1:], funds[0]) if (len(funds) > 0) else 0.0
+
+def _column(x):
+    # a scalar or per-policy parameter as an array that broadcasts against the year axis
+    return np.asarray(x)[..., np.newaxis]
+
+# Policy attributes the deterministic schedules depend on
+SCHEDULE_PARAMS = ['yrs', 'start_age', 'mortality', 'risk_free_rate',
+                   'first_wd_age', 'annuity_start_age', 'last_death_age', 'step_up_period',
+                   'maw_age1', 'maw_rate1', 'maw_age2', 'maw_rate2',
+                   'maw_age3', 'maw_rate3', 'maw_age4', 'maw_rate4']
+
+SCHEDULE_CACHE_SIZE = 1024
+
+class PolicySchedule:
+    # the per-year schedules of calculate that do not depend on the fund path
+    #
+    # parameters may be scalars or per-policy arrays, in which case every schedule has one row per policy;
+    # the arrays are shared between projections and therefore read-only
+
+    def __init__(self, yrs, start_age, mortality, risk_free_rate,
+                 first_wd_age, annuity_start_age, last_death_age, step_up_period,
+                 maw_age1, maw_rate1, maw_age2, maw_rate2,
+                 maw_age3, maw_rate3, maw_age4, maw_rate4):
+        year = np.arange(yrs)
+        age = _column(start_age) + year
+
+        fund1_return = _column(risk_free_rate) + np.zeros(yrs) # index 0 not relevant
+        fund1_return[..., 0] = 0.0
+        df = (1 + _column(risk_free_rate)) ** (-year)
+        growth_phase = ((year > 0) & (age <= _column(first_wd_age)) & (age <= _column(annuity_start_age))
+                        & (age < _column(last_death_age))).astype(int) # index 0 not relevant
+        eligible_step_up = ((year <= _column(step_up_period)) & (growth_phase == 1)).astype(int) # index 0 not relevant
+        last_death = ((year > 0) & (age == _column(last_death_age))).astype(int) # index 0 not relevant
+        max_annual_wd_rate = np.select([(year == 0) | (growth_phase == 1),
+                                        age > _column(maw_age4),
+                                        age > _column(maw_age3),
+                                        age > _column(maw_age2),
+                                        age > _column(maw_age1)],
+                                       [0.0,
+                                        _column(maw_rate4),
+                                        _column(maw_rate3),
+                                        _column(maw_rate2),
+                                        _column(maw_rate1)],
+                                       0.0)
+        qx = _column(mortality) * np.ones(yrs)
+
+        for name, value in [('year', year), ('age', age), ('fund1_return', fund1_return), ('df', df),
+                            ('growth_phase', growth_phase), ('eligible_step_up', eligible_step_up),
+                            ('last_death', last_death), ('max_annual_wd_rate', max_annual_wd_rate), ('qx', qx)]:
+            value.setflags(write=False)
+            setattr(self, name, value)
+
+@functools.lru_cache(maxsize=SCHEDULE_CACHE_SIZE)
+def _cached_schedule(*params):
+    return PolicySchedule(*params)
+
+# arrays of calculate written by the projection kernel, one column of its output buffer each
+KERNEL_FIELDS = ['av_pre_fee', 'fund1_pre_fee', 'fund2_pre_fee', 'm_and_e_fund_fees',
+                 'av_pre_wd', 'fund1_pre_wd', 'fund2_pre_wd',
+                 'av_post_wd', 'fund1_post_wd', 'fund2_post_wd',
+                 'rider_charge', 'av_post_charge', 'fund1_post_charge', 'fund2_post_charge',
+                 'death_payment', 'av_post_death_claim', 'fund1_post_death_claim', 'fund2_post_death_claim',
+                 'fund1_post_rb', 'fund2_post_rb', 'rop_death_base', 'nar_death_claim',
+                 'death_benefit_base', 'wd_base', 'wd_amount', 'cumulative_wd', 'max_annual_wd',
+                 'wd_phase', 'auto_periodic_benefit_status', 'rebalance_indicator', 'wd_claim']
+
+def _project(fund2_return, out,
+             initial_premium, fund1_pre_fee_initial, fund2_pre_fee_initial, m_and_e, fund_fees,
+             first_wd_age, annuity_start_age, last_death_age, wd_rate, rider_charge_rate, rb_target, step_up,
+             age, fund1_return, growth_phase, eligible_step_up, last_death, max_annual_wd_rate, qx, df, contribution):
+    # fused roll-forward of calculate for one fund2_return path, returns (pv_db_claim, pv_wb_claim, pv_rc)
+    #
+    # the running values are local floats (flags as 0.0 / 1.0) and each year is written once,
+    # as out[i] = one value per name in KERNEL_FIELDS; runs as plain Python on lists or compiled
+    # by numba on arrays, see _run_kernel
+    fund1_pre_fee = initial_premium * fund1_pre_fee_initial
+    fund2_pre_fee = initial_premium * fund2_pre_fee_initial
+    av_pre_fee = fund1_pre_fee + fund2_pre_fee
+    m_and_e_fund_fees = 0.0
+    av_pre_wd = av_pre_fee + contribution[0] - m_and_e_fund_fees
+    fund1_pre_wd = 0.0 if (av_pre_wd == 0.0) else fund1_pre_fee * (av_pre_wd / av_pre_fee)
+    fund2_pre_wd = 0.0 if (av_pre_wd == 0.0) else fund2_pre_fee * (av_pre_wd / av_pre_fee)
+    av_post_wd = av_pre_wd
+    fund1_post_wd = 0.0 if (av_post_wd == 0.0) else fund1_pre_wd * (av_post_wd / av_pre_wd)
+    fund2_post_wd = 0.0 if (av_post_wd == 0.0) else fund2_pre_wd * (av_post_wd / av_pre_wd)
+    rider_charge = 0.0
+    av_post_charge = av_post_wd - rider_charge
+    fund1_post_charge = 0.0 if (av_post_charge == 0.0) else fund1_post_wd * (av_post_charge / av_post_wd)
+    fund2_post_charge = 0.0 if (av_post_charge == 0.0) else fund2_post_wd * (av_post_charge / av_post_wd)
+    death_payment = 0.0
+    av_post_death_claim = max(av_post_charge - death_payment, 0.0)
+    fund1_post_death_claim = 0.0 if (av_post_death_claim == 0.0) else fund1_post_charge * (av_post_death_claim / av_post_charge)
+    fund2_post_death_claim = 0.0 if (av_post_death_claim == 0.0) else fund2_post_charge * (av_post_death_claim / av_post_charge)
+    rebalance_indicator = 0.0
+    fund1_post_rb = fund1_post_death_claim
+    fund2_post_rb = av_post_charge - fund1_post_rb
+    rop_death_base = initial_premium
+    nar_death_claim = max(0.0, death_payment - av_post_charge)
+    death_benefit_base = initial_premium
+    wd_base = initial_premium
+    wd_amount = 0.0
+    cumulative_wd = wd_amount
+    max_annual_wd = 0.0
+    wd_phase = 0.0
+    auto_periodic_benefit_status = 0.0
+    wd_claim = 0.0
+
+    pv_db_claim = nar_death_claim * df[0]
+    pv_wb_claim = wd_claim * df[0]
+    pv_rc = rider_charge * df[0]
+
+    yrs = len(fund2_return)
+    i = 0
+    while (True):
+        out[i] = (av_pre_fee, fund1_pre_fee, fund2_pre_fee, m_and_e_fund_fees,
+                  av_pre_wd, fund1_pre_wd, fund2_pre_wd,
+                  av_post_wd, fund1_post_wd, fund2_post_wd,
+                  rider_charge, av_post_charge, fund1_post_charge, fund2_post_charge,
+                  death_payment, av_post_death_claim, fund1_post_death_claim, fund2_post_death_claim,
+                  fund1_post_rb, fund2_post_rb, rop_death_base, nar_death_claim,
+                  death_benefit_base, wd_base, wd_amount, cumulative_wd, max_annual_wd,
+                  wd_phase, auto_periodic_benefit_status, rebalance_indicator, wd_claim)
+        i = i + 1
+        if (i == yrs):
+            break
+
+        # values of year i - 1 still needed once year i starts
+        av_post_death_claim_prev = av_post_death_claim
+        wd_phase_prev = wd_phase
+        wd_base_prev = wd_base
+        wd_amount_prev = wd_amount
+        survival = 1 - qx[i]
+
+        fund1_pre_fee = fund1_post_rb * (1 + fund1_return[i])
+        fund2_pre_fee = fund2_post_rb * (1 + fund2_return[i])
+        av_pre_fee = fund1_pre_fee + fund2_pre_fee
+
+        m_and_e_fund_fees = av_post_death_claim_prev * (m_and_e + fund_fees)
+
+        av_pre_wd = max(0.0, av_pre_fee + contribution[i] - m_and_e_fund_fees)
+        fund1_pre_wd = 0.0 if (av_pre_wd == 0.0) else fund1_pre_fee * (av_pre_wd / av_pre_fee)
+        fund2_pre_wd = 0.0 if (av_pre_wd == 0.0) else fund2_pre_fee * (av_pre_wd / av_pre_fee)
+
+        if (((age[i] > first_wd_age) or (age[i] > annuity_start_age)) and (av_post_death_claim_prev > 0.0)
+            and (age[i] < last_death_age)):
+            wd_phase = 1.0
+        else:
+            wd_phase = 0.0
+
+        if (i == 1 or age[i] >= last_death_age):
+            auto_periodic_benefit_status = 0.0
+        elif ((wd_phase_prev == 1) and (av_post_death_claim_prev == 0.0)):
+            auto_periodic_benefit_status = 1.0
+
+        # up to year 10 the withdrawal base is stepped up after the death claim, so the withdrawal
+        # of the year reads a base of 0.0, as the first branch of the original calculate did;
+        # from year 11 on it is rolled forward first, before the rider charge of the year is known
+        if (i > 10):
+            temp2 = 0.0
+            if (eligible_step_up[i] == 1):
+                temp2 = wd_base_prev * survival * (1 + step_up) + contribution[i] - m_and_e_fund_fees
+            wd_base = max(0.0, wd_base_prev * survival + contribution[i], temp2)
+            max_annual_wd = max_annual_wd_rate[i] * wd_base
+
+            if (wd_phase == 1):
+                wd_amount = wd_rate * wd_base
+            elif (auto_periodic_benefit_status == 1):
+                wd_amount = max_annual_wd
+            else:
+                wd_amount = 0.0
+        else:
+            wd_amount = 0.0
+
+        av_post_wd = max(0.0, av_pre_wd - wd_amount)
+        fund1_post_wd = 0.0 if (av_post_wd == 0.0) else fund1_pre_wd * (av_post_wd / av_pre_wd)
+        fund2_post_wd = 0.0 if (av_post_wd == 0.0) else fund2_pre_wd * (av_post_wd / av_pre_wd)
+
+        rider_charge = rider_charge_rate * av_post_wd
+
+        av_post_charge = av_post_wd - rider_charge
+        fund1_post_charge = 0.0 if (av_post_charge == 0.0) else fund1_post_wd * (av_post_charge / av_post_wd)
+        fund2_post_charge = 0.0 if (av_post_charge == 0.0) else fund2_post_wd * (av_post_charge / av_post_wd)
+
+        if (growth_phase[i] + wd_phase + auto_periodic_benefit_status + last_death[i] == 0):
+            death_payment = 0.0
+        else:
+            death_payment = max(death_benefit_base, rop_death_base) * qx[i]
+
+        av_post_death_claim = max(av_post_charge - death_payment, 0.0)
+        fund1_post_death_claim = 0.0 if (av_post_death_claim == 0.0) else fund1_post_charge * (av_post_death_claim / av_post_charge)
+        fund2_post_death_claim = 0.0 if (av_post_death_claim == 0.0) else fund2_post_charge * (av_post_death_claim / av_post_charge)
+
+        rebalance_indicator = wd_phase + auto_periodic_benefit_status
+        if (rebalance_indicator == 1):
+            fund1_post_rb = av_post_death_claim * rb_target
+        else:
+            fund1_post_rb = fund1_post_death_claim
+        fund2_post_rb = av_post_charge - fund1_post_rb
+
+        rop_death_base = rop_death_base * survival
+
+        nar_death_claim = max(0.0, death_payment - av_post_charge)
+
+        death_benefit_base = max(0.0, death_benefit_base * survival + contribution[i]
+                                 - m_and_e_fund_fees - wd_amount_prev - rider_charge)
+
+        if (i <= 10):
+            temp1 = 0.0
+            if (growth_phase[i] == 1):
+                temp1 = av_post_death_claim
+            temp2 = 0.0
+            if (eligible_step_up[i] == 1):
+                temp2 = wd_base_prev * survival * (1 + step_up) + contribution[i] - m_and_e_fund_fees - rider_charge
+            wd_base = max(temp1, wd_base_prev * survival + contribution[i], temp2)
+            max_annual_wd = max_annual_wd_rate[i] * wd_base
+
+        wd_claim = max(wd_amount - av_post_death_claim_prev, 0.0)
+        cumulative_wd = cumulative_wd + wd_amount
+
+        pv_db_claim = pv_db_claim + nar_death_claim * df[i]
+        pv_wb_claim = pv_wb_claim + wd_claim * df[i]
+        pv_rc = pv_rc + rider_charge * df[i]
+
+    return pv_db_claim, pv_wb_claim, pv_rc
+
+if (numba is not None):
+    _project_jit = numba.njit(cache=True)(_project)
+
+def _run_kernel(policy, schedule, fund2_return):
+    # runs _project for one path, compiled when numba is installed, and returns (out, pvs)
+    # with out a (yrs, len(KERNEL_FIELDS)) float array
+    params = (policy.initial_premium, policy.fund1_pre_fee_initial, policy.fund2_pre_fee_initial,
+              policy.m_and_e, policy.fund_fees, policy.first_wd_age, policy.annuity_start_age,
+              policy.last_death_age, policy.wd_rate, policy.rider_charge_rate, policy.rb_target, policy.step_up)
+    schedules = (schedule.age, schedule.fund1_return, schedule.growth_phase, schedule.eligible_step_up,
+                 schedule.last_death, schedule.max_annual_wd_rate, schedule.qx, schedule.df, policy.contribution)
+    fund2_return = np.asarray(fund2_return, dtype=float)
+    if (numba is not None):
+        out = np.empty((len(fund2_return), len(KERNEL_FIELDS)))
+        pvs = _project_jit(fund2_return, out, *(params + schedules))
+        return out, pvs
+    # element access on Python lists and floats is far cheaper than on NumPy arrays
+    out = [None] * len(fund2_return)
+    pvs = _project(fund2_return.tolist(), out, *(params + tuple(np.asarray(x).tolist() for x in schedules)))
+    out = np.fromiter(itertools.chain.from_iterable(out), float, len(fund2_return) * len(KERNEL_FIELDS))
+    return out.reshape(len(fund2_return), len(KERNEL_FIELDS)), pvs
+
+def _rows(index, *arrays):
+    # arrays restricted to the scenarios at index; scalar parameters are shared by every scenario
+    # and come back as they are
+    return [x[index] if (np.ndim(x) > 0) else x for x in arrays]
+
+def _ruined_tail(start, pv_db_claim, pv_wb_claim, wd_phase, auto_periodic_benefit_status, wd_base, wd_amount,
+                 death_benefit_base, rop_death_base,
+                 age, qx, df, growth_phase, eligible_step_up, last_death, max_annual_wd_rate, step_up, last_death_age):
+    # pv_db_claim and pv_wb_claim, carried on from year start (at least 2) to the last year, of paths whose
+    # account ran out in year start - 1 (av_post_charge == 0.0) and gets no more contributions
+    #
+    # an empty account stays empty, so fund2_return no longer matters: wd_phase stays 0,
+    # auto_periodic_benefit_status stays latched until last_death_age, every withdrawal is a wd_claim and
+    # every death_payment a nar_death_claim, and the bases only roll forward with survival; the remaining
+    # years are summed in closed form, with per-year factors shared by all paths unless the schedules
+    # are per-policy
+    year = np.arange(start, qx.shape[-1])
+    survival = 1 - qx[..., year]
+    lived = np.cumprod(survival, axis=-1)
+    lived_before = np.concatenate([np.ones_like(lived[..., :1]), lived[..., :-1]], axis=-1)
+    latched = (wd_phase == 1) | (auto_periodic_benefit_status == 1)
+    auto_open = age[..., year] < _column(last_death_age)
+
+    # withdrawals of latched paths: max_annual_wd off a wd_base grown by survival, and by 1 + step_up
+    # in step-up years, i.e. wd_base times wd_factor
+    growth = np.where(eligible_step_up[..., year] == 1, np.maximum(1.0, 1 + _column(step_up)), 1.0)
+    wd_factor = np.where(auto_open & (year > 10), max_annual_wd_rate[..., year], 0.0) * np.cumprod(survival * growth, axis=-1)
+    latched_base = np.where(latched, wd_base, 0.0)
+    pv_wb_claim = pv_wb_claim + latched_base * (wd_factor * df[..., year]).sum(axis=-1)
+
+    # death_payment of year j reads the bases of year j - 1: rop_death_base * lived_before and
+    # max(0.0, lived_before * (death_benefit_base - withdrawn)), where withdrawn adds up the earlier
+    # withdrawals, each over the survival up to the year after it; the larger of the two is
+    # lived_before * (rop_death_base + max(0.0, death_benefit_base - rop_death_base - withdrawn))
+    withdrawn_factor = np.cumsum(wd_factor[..., :-1] / lived[..., 1:], axis=-1)
+    withdrawn_factor = np.concatenate([np.zeros(withdrawn_factor.shape[:-1] + (2,)), withdrawn_factor[..., :-1]],
+                                      axis=-1)[..., :len(year)]
+    withdrawn = (np.where(year > start, 1 / lived[..., :1], 0.0) * wd_amount[:, np.newaxis]
+                 + withdrawn_factor * latched_base[:, np.newaxis])
+    paid = growth_phase[..., year] + last_death[..., year] != 0
+    weight = qx[..., year] * lived_before * df[..., year]
+    weight = np.where(latched[:, np.newaxis], np.where(paid | auto_open, weight, 0.0), np.where(paid, weight, 0.0))
+    excess = np.maximum(0.0, (death_benefit_base - rop_death_base)[:, np.newaxis] - withdrawn)
+    pv_db_claim = pv_db_claim + rop_death_base * weight.sum(axis=-1) + (weight * excess).sum(axis=-1)
+    return pv_db_claim, pv_wb_claim
+
+# project_batch without kept columns stops projecting the paths whose account has run out, and finishes
+# them by _ruined_tail, once they make up this share of the paths still projected
+RUIN_DROP_SHARE = 0.2
+
+# per-fund arrays of Policy.project_funds, fund_<name> holding fund1_<name>, fund2_<name>, ...
+FUND_FIELDS = ['fund_pre_fee', 'fund_pre_wd', 'fund_post_wd', 'fund_post_charge', 'fund_post_death_claim', 'fund_post_rb']
+
+# the other arrays of KERNEL_FIELDS, one per account
+ACCOUNT_FIELDS = [name for name in KERNEL_FIELDS if (not name.startswith('fund'))]
+
+# the values of one year that the projection of the following years reads, see Policy.project_funds
+STATE_FIELDS = ['fund_post_rb', 'av_post_death_claim', 'wd_phase', 'auto_periodic_benefit_status',
+                'wd_base', 'wd_amount', 'death_benefit_base', 'rop_death_base', 'cumulative_wd']
+
+# per-year arrays of a Policy, stored as the rows of one value block and one flag block
+VALUE_FIELDS = ['contribution', 'av_pre_fee', 'fund1_pre_fee', 'fund2_pre_fee', 'm_and_e_fund_fees',
+                'av_pre_wd', 'fund1_pre_wd', 'fund2_pre_wd',
+                'av_post_wd', 'fund1_post_wd', 'fund2_post_wd',
+                'rider_charge', 'av_post_charge', 'fund1_post_charge', 'fund2_post_charge',
+                'death_payment', 'av_post_death_claim', 'fund1_post_death_claim', 'fund2_post_death_claim',
+                'fund1_post_rb', 'fund2_post_rb', 'rop_death_base', 'nar_death_claim',
+                'death_benefit_base', 'wd_base', 'wd_amount', 'cumulative_wd', 'max_annual_wd', 'max_annual_wd_rate',
+                'fund1_return', 'fund2_return', # index 0 not relevant
+                'df', 'qx',
+                'death_claim', # same as nar_death_claim
+                'wd_claim']
+
+FLAG_FIELDS = ['eligible_step_up', 'growth_phase', 'wd_phase', 'auto_periodic_benefit_status', 'last_death', # index 0 not relevant
+               'rebalance_indicator']
+
+# storage of the per-year arrays, selected by Policy.precision: 'double' keeps float64 values and int flags,
+# 'single' stores float32 values and int8 flags for large runs limited by memory bandwidth
+PRECISIONS = {'double': (np.float64, int),
+              'single': (np.float32, np.int8)}
+
+# column headers of the Cashflow and PV sheets of output_to_excel, with the Policy attribute behind each
+CASHFLOW_COLUMNS = [('Year', 'year'),
+                    ('Anniversary', 'anniversary'),
+                    ('Age', 'age'),
+                    ('Contribution', 'contribution'),
+                    ('AV_Pre_Fee', 'av_pre_fee'),
+                    ('Fund1_Pre_Fee', 'fund1_pre_fee'),
+                    ('Fund2_Pre_Fee', 'fund2_pre_fee'),
+                    ('M_and_E_Fund_Fees', 'm_and_e_fund_fees'),
+                    ('AV_Pre_Withdrawal', 'av_pre_wd'),
+                    ('Fund1_Pre_Withdrawal', 'fund1_pre_wd'),
+                    ('Fund2_Pre_Withdrawal', 'fund2_pre_wd'),
+                    ('AV_Post_Withdrawal', 'av_post_wd'),
+                    ('Fund1_Post_Withdrawal', 'fund1_post_wd'),
+                    ('Fund2_Post_Withdrawal', 'fund2_post_wd'),
+                    ('Rider_Charge', 'rider_charge'),
+                    ('AV_Post_Charge', 'av_post_charge'),
+                    ('Fund1_Post_Charge', 'fund1_post_charge'),
+                    ('Fund2_Post_Charge', 'fund2_post_charge'),
+                    ('Death_Payment', 'death_payment'),
+                    ('AV_Post_Death_Claim', 'av_post_death_claim'),
+                    ('Fund1_Post_Death_Claim', 'fund1_post_death_claim'),
+                    ('Fund2_Post_Death_Claim', 'fund2_post_death_claim'),
+                    ('Fund1_Post_Rebalance', 'fund1_post_rb'),
+                    ('Fund2_Post_Rebalance', 'fund2_post_rb'),
+                    ('ROP_Death_Base', 'rop_death_base'),
+                    ('NAR_Death_Claim', 'nar_death_claim'),
+                    ('Death_Benefit_Base', 'death_benefit_base'),
+                    ('Withdrawal_Base', 'wd_base'),
+                    ('Withdrawal_Amount', 'wd_amount'),
+                    ('Cumulative_Withdrawal', 'cumulative_wd'),
+                    ('Maximum_Annual_Withdrawal', 'max_annual_wd'),
+                    ('Maximum_Annual_Withdrawal_Rate', 'max_annual_wd_rate'),
+                    ('Eligible_Step_Up', 'eligible_step_up'),
+                    ('Growth_Phase', 'growth_phase'),
+                    ('Withdrawal_Phase', 'wd_phase'),
+                    ('Automatic_Periodic_Benefit_Status', 'auto_periodic_benefit_status'),
+                    ('Last_Death', 'last_death'),
+                    ('Fund1_Return', 'fund1_return'),
+                    ('Fund2_Return', 'fund2_return'),
+                    ('Rebalance_Indicator', 'rebalance_indicator'),
+                    ('DF', 'df'),
+                    ('qx', 'qx'),
+                    ('Death_Claim', 'death_claim'),
+                    ('Withdrawal_Claim', 'wd_claim')]
+
+PV_COLUMNS = [('PV_DB_Claim', 'pv_db_claim'),
+              ('PV_WB_Claim', 'pv_wb_claim'),
+              ('PV_RC', 'pv_rc')]
+
 class Policy:
     # class attributes
     
@@ -41,6 +437,9 @@ class Policy:
     fund1_pre_fee_initial = 0.16
     fund2_pre_fee_initial = 0.64
 
+    precision = 'double'
+    instrumentation = NO_INSTRUMENTATION
+
     def __init__(self):
         self.year = np.arange(self.yrs)
         self.age = np.arange(self.start_age, self.start_age + self.yrs)
@@ -50,561 +449,398 @@ class Policy:
             d = dt.date(2016+i, 8, 1)
             self.anniversary.append(d.isoformat())
 
-        self.contribution = np.zeros(self.yrs)
-        self.av_pre_fee = np.zeros(self.yrs)
-        self.fund1_pre_fee = np.zeros(self.yrs)
-        self.fund2_pre_fee = np.zeros(self.yrs)
-
-        self.m_and_e_fund_fees = np.zeros(self.yrs)
-
-        self.av_pre_wd = np.zeros(self.yrs)
-        self.fund1_pre_wd = np.zeros(self.yrs)
-        self.fund2_pre_wd = np.zeros(self.yrs)
-
-        self.av_post_wd = np.zeros(self.yrs)
-        self.fund1_post_wd = np.zeros(self.yrs)
-        self.fund2_post_wd = np.zeros(self.yrs)
-
-        self.rider_charge = np.zeros(self.yrs)
+        # every per-year array is a named row of one of two contiguous blocks
+        value_dtype, flag_dtype = PRECISIONS[self.precision]
+        self.values = np.zeros((len(VALUE_FIELDS), self.yrs), dtype=value_dtype)
+        self.flags = np.zeros((len(FLAG_FIELDS), self.yrs), dtype=flag_dtype)
+        for name, row in zip(VALUE_FIELDS, self.values):
+            setattr(self, name, row)
+        for name, row in zip(FLAG_FIELDS, self.flags):
+            setattr(self, name, row)
 
-        self.av_post_charge = np.zeros(self.yrs)
-        self.fund1_post_charge = np.zeros(self.yrs)
-        self.fund2_post_charge = np.zeros(self.yrs)
-
-        self.death_payment = np.zeros(self.yrs)
-
-        self.av_post_death_claim = np.zeros(self.yrs)
-
-        self.fund1_post_death_claim = np.zeros(self.yrs)
-        self.fund2_post_death_claim = np.zeros(self.yrs)
-        self.fund1_post_rb = np.zeros(self.yrs)
-        self.fund2_post_rb = np.zeros(self.yrs)
-
-        self.rop_death_base = np.zeros(self.yrs)
-        self.nar_death_claim = np.zeros(self.yrs)
-
-        self.death_benefit_base = np.zeros(self.yrs)
-        self.wd_base = np.zeros(self.yrs)
-        self.wd_amount = np.zeros(self.yrs)
-        self.cumulative_wd = np.zeros(self.yrs)
-        self.max_annual_wd = np.zeros(self.yrs)
-        self.max_annual_wd_rate = np.zeros(self.yrs)
-
-        self.eligible_step_up = np.zeros((self.yrs,), dtype=int) # index 0 not relevant
-        self.growth_phase = np.zeros((self.yrs,), dtype=int) # index 0 not relevant
-        self.wd_phase = np.zeros((self.yrs,), dtype=int) # index 0 not relevant
-        self.auto_periodic_benefit_status = np.zeros((self.yrs,), dtype=int) # index 0 not relevant
-        self.last_death = np.zeros((self.yrs,), dtype=int) # index 0 not relevant
-
-        self.fund1_return = np.zeros(self.yrs) # index 0 not relevant
-        self.fund2_return = np.zeros(self.yrs) # index 0 not relevant
-
-        self.rebalance_indicator = np.zeros((self.yrs,), dtype=int)
-        self.df = np.zeros(self.yrs)
-
-        self.qx = self.mortality * np.ones(self.yrs)
-
-        self.death_claim = np.zeros(self.yrs) # same as nar_death_claim
-        self.wd_claim = np.zeros(self.yrs)
+        self.qx[:] = self.mortality
 
         self.pv_db_claim = 0.0
         self.pv_wb_claim = 0.0
         self.pv_rc = 0.0
 
-    def generate_fund2_return(self):
-        for i in range(self.yrs):
-            if (i > 0):
-                self.fund2_return[i] = np.exp(np.log(1+self.risk_free_rate)-0.5*(self.volatility**2)+self.volatility*np.random.standard_normal()) - 1
+    def schedule(self):
+        # PolicySchedule of this contract, memoized on SCHEDULE_PARAMS with LRU eviction
+        # when all of them are scalars, built in bulk otherwise
+        params = tuple(getattr(self, name) for name in SCHEDULE_PARAMS)
+        if (not any(isinstance(value, np.ndarray) for value in params)):
+            return _cached_schedule(*params)
+        return PolicySchedule(*params)
+
+    def generate_fund2_return(self, rng=None):
+        # rng is an optional numpy.random.Generator, the global legacy generator is used otherwise
+        if (rng is None):
+            z = np.random.standard_normal(self.yrs - 1)
+        else:
+            z = rng.standard_normal(self.yrs - 1)
+        self.fund2_return[1:] = np.exp(np.log(1+self.risk_free_rate)-0.5*(self.volatility**2)+self.volatility*z) - 1
 
     def manually_input_fund2_return(self, fund2_return):
-        self.fund2_return = fund2_return
+        self.fund2_return[:] = fund2_return
 
     def calculate(self):
-        for i in range(self.yrs):
-            if (i > 0):
-                self.fund1_return[i] = self.risk_free_rate
-
-        for i in range(self.yrs):
-            self.df[i] = (1 + self.risk_free_rate) ** (-self.year[i])
-
-        for i in range(self.yrs):
-            if (i > 0):
-                if ((self.age[i] <= self.first_wd_age) and (self.age[i] <= self.annuity_start_age) and (self.age[i] < self.last_death_age)):
-                    self.growth_phase[i] = 1
-                else:
-                    self.growth_phase[i] = 0
-
-        for i in range(self.yrs):
-            if (i > 0):
-                if ((self.year[i] <= self.step_up_period) and (self.growth_phase[i] == 1)):
-                    self.eligible_step_up[i] = 1
-                else:
-                    self.eligible_step_up[i] = 0
-
-        for i in range(self.yrs):
-            if (i > 0):
-                if (self.age[i] == self.last_death_age):
-                    self.last_death[i] = 1
-                else:
-                    self.last_death[i] = 0
-
-        self.max_annual_wd_rate[0] = 0.0
-        for i in range(self.yrs):
-            if (i > 0):
-                if (self.growth_phase[i] == 1):
-                    self.max_annual_wd_rate[i] = 0.0
-                else:
-                    if (self.age[i] > self.maw_age4):
-                        self.max_annual_wd_rate[i] = self.maw_rate4
-                    else:
-                        if (self.age[i] > self.maw_age3):
-                            self.max_annual_wd_rate[i] = self.maw_rate3
-                        else:
-                            if (self.age[i] > self.maw_age2):
-                                self.max_annual_wd_rate[i] = self.maw_rate2
-                            else:
-                                if (self.age[i] > self.maw_age1):
-                                    self.max_annual_wd_rate[i] = self.maw_rate1
-                                else:
-                                    self.max_annual_wd_rate[i] = 0.0
-
-        self.fund1_pre_fee[0] = self.initial_premium * self.fund1_pre_fee_initial
-        self.fund2_pre_fee[0] = self.initial_premium * self.fund2_pre_fee_initial
-        self.av_pre_fee[0] = self.fund1_pre_fee[0] + self.fund2_pre_fee[0]
-
-        self.m_and_e_fund_fees[0] = 0.0
-        self.av_pre_wd[0] = self.av_pre_fee[0] + self.contribution[0] - self.m_and_e_fund_fees[0]
-
-        if (self.av_pre_wd[0] == 0.0):
-            self.fund1_pre_wd[0] = 0.0
-        else:
-            self.fund1_pre_wd[0] = self.fund1_pre_fee[0] * (self.av_pre_wd[0] / self.av_pre_fee[0])
-
-        if (self.av_pre_wd[0] == 0.0):
-            self.fund2_pre_wd[0] = 0.0
+        probe = self.instrumentation
+        probe.start()
+        schedule = self.schedule()
+        self.fund1_return[:] = schedule.fund1_return
+        self.df[:] = schedule.df
+        self.growth_phase[:] = schedule.growth_phase
+        self.eligible_step_up[:] = schedule.eligible_step_up
+        self.last_death[:] = schedule.last_death
+        self.max_annual_wd_rate[:] = schedule.max_annual_wd_rate
+        self.qx[:] = schedule.qx
+        probe.lap('schedule')
+
+        # the fused kernel rolls the account, the bases and the PVs forward in one pass, so they are
+        # timed as one stage here; the batched projection times them one by one
+        out, pvs = _run_kernel(self, schedule, self.fund2_return)
+        probe.lap('kernel')
+        for name, column in zip(KERNEL_FIELDS, out.T):
+            getattr(self, name)[:] = column
+        self.death_claim[:] = self.nar_death_claim
+
+        self.pv_db_claim, self.pv_wb_claim, self.pv_rc = pvs
+        probe.lap('store')
+        probe.count('projections')
+        probe.count('projection_years', self.yrs)
+        probe.count('ruined_paths', self.av_post_death_claim[-1] == 0.0)
+        probe.finish('calculate')
+
+    def calculate_batch(self, fund2_return):
+        # same projection as calculate, run for all scenarios at once
+        # fund2_return has one scenario per row, shape (n_scenarios, yrs), index 0 not relevant
+        # returns per-scenario pv_db_claim, pv_wb_claim and pv_rc arrays
+        results = self.project_batch(fund2_return)
+        return results['pv_db_claim'], results['pv_wb_claim'], results['pv_rc']
+
+    def project_batch(self, fund2_return, columns=(), start=0, state=None):
+        # calculate_batch, also keeping the per-year arrays of calculate named in columns
+        # (any of KERNEL_FIELDS) with shape (n_scenarios, yrs)
+        # returns a dict of pv_db_claim, pv_wb_claim, pv_rc and the kept columns
+        #
+        # given a state of year start, see project_funds, with fund1_post_rb and fund2_post_rb in
+        # place of fund_post_rb, only the years after start are projected
+        #
+        # the two funds of calculate as project_funds sees them: fund1 earns the schedule's
+        # fund1_return, fund2 the scenario's fund2_return, and rebalancing puts rb_target in fund1
+        value_dtype, flag_dtype = PRECISIONS[self.precision]
+        fund2_return = np.asarray(fund2_return, dtype=value_dtype)
+        if (fund2_return.ndim != 2 or fund2_return.shape[1] != self.yrs):
+            raise ValueError("fund2_return must have shape (n_scenarios, %d)" % self.yrs)
+        unknown = [name for name in columns if (name not in KERNEL_FIELDS)]
+        if (len(unknown) > 0):
+            raise ValueError("unknown columns: %s" % ", ".join(unknown))
+
+        # fund1_<name> and fund2_<name> are the two funds of fund_<name>
+        schedule = self.schedule()
+        fund_columns = [name for name in FUND_FIELDS if (any(fund + name[4:] in columns for fund in ['fund1', 'fund2']))]
+        if (state is not None):
+            state = dict(state, fund_post_rb=[state['fund1_post_rb'], state['fund2_post_rb']])
+        results = self.project_funds([schedule.fund1_return, fund2_return],
+                                     [self.fund1_pre_fee_initial, self.fund2_pre_fee_initial],
+                                     [self.rb_target, 1 - np.asarray(self.rb_target)],
+                                     [name for name in columns if (name in ACCOUNT_FIELDS)] + fund_columns, schedule,
+                                     start, state)
+        for name in fund_columns:
+            funds = results.pop(name)
+            for k, fund in enumerate(['fund1', 'fund2']):
+                if (fund + name[4:] in columns):
+                    results[fund + name[4:]] = funds[:, k]
+        return results
+
+    def project_funds(self, fund_returns, fund_pre_fee_initial, rb_weights, columns=(), schedule=None,
+                      start=0, state=None):
+        # the batched projection of calculate with the account spread over any number of funds
+        #
+        # fund_returns holds the returns of each fund, index 0 not relevant, with shape (n_scenarios, yrs)
+        # or, for a fund earning the same in every scenario, (yrs,); fund_pre_fee_initial (the share of
+        # initial_premium in each fund) and rb_weights (the share of each fund after a rebalance) hold a
+        # scalar or per-policy array per fund; fees, withdrawals and charges come out of the funds pro rata
+        # and, as in calculate, the last fund takes the account value after the rider charge less the
+        # other funds, so it also carries the death payment
+        #
+        # columns may name any of ACCOUNT_FIELDS, kept with shape (n_scenarios, yrs), and any of
+        # FUND_FIELDS, kept with shape (n_scenarios, n_funds, yrs)
+        # returns a dict of pv_db_claim, pv_wb_claim, pv_rc and the kept columns
+        #
+        # state, if given, holds the STATE_FIELDS arrays of year start, one value per scenario (fund_post_rb
+        # as one array per fund): the projection picks up from there, so the PVs cover years start + 1, ...
+        # only, discounted to year 0 like the others, and kept columns are 0 up to year start
+        #
+        # the projection runs in the value and flag types of self.precision, PVs are summed in float64
+        #
+        # with self.instrumentation, the time of every year goes to the stages 'account' (funds and account
+        # values), 'bases' (withdrawal and death benefit bases, withdrawals and claims), 'store' (kept
+        # columns), 'pv' and 'ruined_tail', after the 'setup' of the inputs and year 0
+        probe = self.instrumentation
+        probe.start()
+        value_dtype, flag_dtype = PRECISIONS[self.precision]
+        fund_returns = [np.asarray(fund_return, dtype=value_dtype) for fund_return in fund_returns]
+        n = set(fund_return.shape[0] for fund_return in fund_returns if (fund_return.ndim == 2))
+        if (len(n) != 1 or any(fund_return.ndim not in (1, 2) or fund_return.shape[-1] != self.yrs
+                               for fund_return in fund_returns)):
+            raise ValueError("fund_returns must have shape (%d,) or (n_scenarios, %d), with at least one "
+                             "fund per scenario and the same n_scenarios for all" % (self.yrs, self.yrs))
+        if (len(fund_pre_fee_initial) != len(fund_returns) or len(rb_weights) != len(fund_returns)):
+            raise ValueError("fund_pre_fee_initial and rb_weights need one entry per fund")
+        unknown = [name for name in columns if (name not in ACCOUNT_FIELDS and name not in FUND_FIELDS)]
+        if (len(unknown) > 0):
+            raise ValueError("unknown columns: %s" % ", ".join(unknown))
+        n = n.pop()
+        n_funds = len(fund_returns)
+
+        # kept columns are views on one (n_columns, ...) block per type and shape, the fund columns
+        # filled fund by fund as (n_funds, n_scenarios, yrs) and returned as transposed views
+        kept = [(name, (ACCOUNT_FIELDS + FUND_FIELDS).index(name)) for name in columns]
+        value_columns = [name for name in columns if (name in ACCOUNT_FIELDS and name not in FLAG_FIELDS)]
+        flag_columns = [name for name in columns if (name in FLAG_FIELDS)]
+        fund_columns = [name for name in columns if (name in FUND_FIELDS)]
+        results = dict(zip(value_columns, np.zeros((len(value_columns), n, self.yrs), dtype=value_dtype)))
+        results.update(zip(flag_columns, np.zeros((len(flag_columns), n, self.yrs), dtype=flag_dtype)))
+        results.update(zip(fund_columns, np.zeros((len(fund_columns), n_funds, n, self.yrs), dtype=value_dtype)))
+
+        # contract parameters may also be per-policy arrays of length n_scenarios, see inforce.py
+        schedule = self.schedule() if (schedule is None) else schedule
+        age = schedule.age
+        qx = schedule.qx.astype(value_dtype, copy=False)
+        df = schedule.df.astype(value_dtype, copy=False)
+        growth_phase = schedule.growth_phase
+        eligible_step_up = schedule.eligible_step_up
+        last_death = schedule.last_death
+        max_annual_wd_rate = schedule.max_annual_wd_rate.astype(value_dtype, copy=False)
+        contribution = self.contribution.astype(value_dtype, copy=False)
+
+        fee_rate = np.asarray(self.m_and_e + self.fund_fees, dtype=value_dtype)
+        wd_rate = np.asarray(self.wd_rate, dtype=value_dtype)
+        rider_charge_rate = np.asarray(self.rider_charge_rate, dtype=value_dtype)
+        step_up = np.asarray(self.step_up, dtype=value_dtype)
+        first_wd_age = self.first_wd_age
+        annuity_start_age = self.annuity_start_age
+        last_death_age = self.last_death_age
+
+        # per-fund values are lists of one array per fund: the projection is bound by memory traffic,
+        # and a stacked (n_funds, n_scenarios) state costs more in temporaries than it saves in calls
+        rb_weights = [np.asarray(weight, dtype=value_dtype) for weight in rb_weights]
+
+        if (state is None):
+            # year 0, identical for every scenario
+            fund_pre_fee = [np.full(n, self.initial_premium * weight, dtype=value_dtype) for weight in fund_pre_fee_initial]
+            av_pre_fee = _total(fund_pre_fee)
+            m_and_e_fund_fees = np.zeros(n, dtype=value_dtype)
+            av_pre_wd = av_pre_fee + contribution[..., 0] - m_and_e_fund_fees
+            fund_pre_wd = [_pro_rata(fund, av_pre_wd, av_pre_fee) for fund in fund_pre_fee]
+            av_post_wd = av_pre_wd
+            fund_post_wd = [_pro_rata(fund, av_post_wd, av_pre_wd) for fund in fund_pre_wd]
+            rider_charge = np.zeros(n, dtype=value_dtype)
+            av_post_charge = av_post_wd - rider_charge
+            fund_post_charge = [_pro_rata(fund, av_post_charge, av_post_wd) for fund in fund_post_wd]
+            death_payment = np.zeros(n, dtype=value_dtype)
+            av_post_death_claim = np.maximum(av_post_charge - death_payment, 0.0)
+            fund_post_death_claim = [_pro_rata(fund, av_post_death_claim, av_post_charge) for fund in fund_post_charge]
+            rebalance_indicator = np.zeros(n, dtype=flag_dtype)
+            fund_post_rb = fund_post_death_claim[:-1]
+            fund_post_rb = fund_post_rb + [av_post_charge - _total(fund_post_rb)]
+            rop_death_base = np.full(n, self.initial_premium, dtype=value_dtype)
+            nar_death_claim = np.maximum(0.0, death_payment - av_post_charge)
+            death_benefit_base = np.full(n, self.initial_premium, dtype=value_dtype)
+            wd_base = np.full(n, self.initial_premium, dtype=value_dtype)
+            wd_amount = np.zeros(n, dtype=value_dtype)
+            cumulative_wd = wd_amount
+            max_annual_wd = np.zeros(n, dtype=value_dtype)
+            wd_phase = np.zeros(n, dtype=flag_dtype)
+            auto_periodic_benefit_status = np.zeros(n, dtype=flag_dtype)
+            wd_claim = np.zeros(n, dtype=value_dtype)
+            first_year = 0
         else:
-            self.fund2_pre_wd[0] = self.fund2_pre_fee[0] * (self.av_pre_wd[0] / self.av_pre_fee[0])
-
-        self.av_post_wd[0] = self.av_pre_wd[0]
-
-        if (self.av_post_wd[0] == 0.0):
-            self.fund1_post_wd[0] = 0.0
-        else:
-            self.fund1_post_wd[0] = self.fund1_pre_wd[0] * (self.av_post_wd[0] / self.av_pre_wd[0])
-
-        if (self.av_post_wd[0] == 0.0):
-            self.fund2_post_wd[0] = 0.0
-        else:
-            self.fund2_post_wd[0] = self.fund2_pre_wd[0] * (self.av_post_wd[0] / self.av_pre_wd[0])
-
-        self.rider_charge[0] = 0.0
-
-        self.av_post_charge[0] = self.av_post_wd[0] - self.rider_charge[0]
-
-        if (self.av_post_charge[0] == 0.0):
-            self.fund1_post_charge[0] = 0.0
-        else:
-            self.fund1_post_charge[0] = self.fund1_post_wd[0] * (self.av_post_charge[0] / self.av_post_wd[0])
-
-        if (self.av_post_charge[0] == 0.0):
-            self.fund2_post_charge[0] = 0.0
-        else:
-            self.fund2_post_charge[0] = self.fund2_post_wd[0] * (self.av_post_charge[0] / self.av_post_wd[0])
-
-        self.death_payment[0] = 0.0
-
-        self.av_post_death_claim[0] = np.max([self.av_post_charge[0]-self.death_payment[0],0.0])
-
-        if (self.av_post_death_claim[0] == 0.0):
-            self.fund1_post_death_claim[0] = 0.0
-        else:
-            self.fund1_post_death_claim[0] = self.fund1_post_charge[0] * (self.av_post_death_claim[0] / self.av_post_charge[0])
-
-        if (self.av_post_death_claim[0] == 0.0):
-            self.fund2_post_death_claim[0] = 0.0
-        else:
-            self.fund2_post_death_claim[0] = self.fund2_post_charge[0] * (self.av_post_death_claim[0] / self.av_post_charge[0])
-
-        self.rebalance_indicator[0] = 0
-
-        if (self.rebalance_indicator[0] == 1):
-            self.fund1_post_rb[0] = self.av_post_death_claim[0] * self.rb_target
-        else:
-            self.fund1_post_rb[0] = self.fund1_post_death_claim[0]
-
-        self.fund2_post_rb[0] = self.av_post_charge[0] - self.fund1_post_rb[0]
-
-        self.rop_death_base[0] = self.initial_premium
-
-        self.nar_death_claim[0] = np.max([0.0,self.death_payment[0]-self.av_post_charge[0]])
-
-        self.death_benefit_base[0] = self.initial_premium
-
-        self.wd_base[0] = self.initial_premium
-
-        self.wd_amount[0] = 0.0
-
-        self.max_annual_wd[0] = 0.0
-
-        self.wd_claim[0] = 0.0
+            # year start, from state
+            missing = [name for name in STATE_FIELDS if (name not in state)]
+            if (len(missing) > 0):
+                raise ValueError("state lacks %s" % ", ".join(missing))
+            fund_post_rb = [np.full(n, fund, dtype=value_dtype) for fund in state['fund_post_rb']]
+            av_post_death_claim = np.full(n, state['av_post_death_claim'], dtype=value_dtype)
+            wd_phase = np.full(n, state['wd_phase'], dtype=flag_dtype)
+            auto_periodic_benefit_status = np.full(n, state['auto_periodic_benefit_status'], dtype=flag_dtype)
+            wd_base = np.full(n, state['wd_base'], dtype=value_dtype)
+            wd_amount = np.full(n, state['wd_amount'], dtype=value_dtype)
+            death_benefit_base = np.full(n, state['death_benefit_base'], dtype=value_dtype)
+            rop_death_base = np.full(n, state['rop_death_base'], dtype=value_dtype)
+            cumulative_wd = np.full(n, state['cumulative_wd'], dtype=value_dtype)
+            first_year = start + 1
+
+        pv_db_claim = np.zeros(n)
+        pv_wb_claim = np.zeros(n)
+        pv_rc = np.zeros(n)
+
+        # scenarios still projected, as positions in fund_returns; the others have their PVs in pv_out
+        #
+        # without kept columns, paths whose account has run out leave the loop and are finished by
+        # _ruined_tail, once no contribution could refill the account, see RUIN_DROP_SHARE; only when the
+        # schedules are shared by every scenario, as copying per-policy schedules costs more than it saves
+        active = np.arange(n)
+        pv_out = np.zeros((len(PV_COLUMNS), n))
+        drop_ruined = (len(kept) == 0 and all(np.ndim(x) == 1 for x in (age, qx, growth_phase, eligible_step_up,
+                                                                         last_death, max_annual_wd_rate, contribution)))
+        last_contribution = np.flatnonzero(np.reshape(contribution != 0.0, (-1, self.yrs)).any(axis=0))
+        first_drop = max(last_contribution[-1] if (len(last_contribution) > 0) else 0, 1)
+        probe.lap('setup')
+
+        for i in range(first_year, self.yrs):
+            if (i > 0):
+                survival = 1 - qx[..., i]
 
-        self.auto_periodic_benefit_status[1] = 0
+                fund_pre_fee = [fund * (1 + fund_return[..., i]) for fund, fund_return in zip(fund_post_rb, fund_returns)]
+                av_pre_fee = _total(fund_pre_fee)
 
-        for i in range(self.yrs):
-            if ((i > 0) and (i <= 10)):
-                self.fund1_pre_fee[i] = self.fund1_post_rb[i-1] * (1 + self.fund1_return[i])
-                self.fund2_pre_fee[i] = self.fund2_post_rb[i-1] * (1 + self.fund2_return[i])
-                self.av_pre_fee[i] = self.fund1_pre_fee[i] + self.fund2_pre_fee[i]
+                m_and_e_fund_fees = av_post_death_claim * fee_rate
 
-                self.m_and_e_fund_fees[i] = self.av_post_death_claim[i-1] * (self.m_and_e + self.fund_fees)
+                av_pre_wd = np.maximum(0.0, av_pre_fee + contribution[..., i] - m_and_e_fund_fees)
+                fund_pre_wd = [_pro_rata(fund, av_pre_wd, av_pre_fee) for fund in fund_pre_fee]
+                probe.lap('account')
 
-                self.av_pre_wd[i] = np.max([0.0, self.av_pre_fee[i]+self.contribution[i]-self.m_and_e_fund_fees[i]])
+                wd_phase_prev = wd_phase
+                wd_phase = (((age[..., i] > first_wd_age) | (age[..., i] > annuity_start_age))
+                            & (av_post_death_claim > 0.0) & (age[..., i] < last_death_age)).astype(flag_dtype)
 
-                if (self.av_pre_wd[i] == 0.0):
-                    self.fund1_pre_wd[i] = 0.0
-                else:
-                    self.fund1_pre_wd[i] = self.fund1_pre_fee[i] * (self.av_pre_wd[i] / self.av_pre_fee[i])
-                
-                if (self.av_pre_wd[i] == 0.0):
-                    self.fund2_pre_wd[i] = 0.0
-                else:
-                    self.fund2_pre_wd[i] = self.fund2_pre_fee[i] * (self.av_pre_wd[i] / self.av_pre_fee[i])
-                
-                if (((self.age[i] > self.first_wd_age) or (self.age[i] > self.annuity_start_age)) and (self.av_post_death_claim[i-1] > 0.0)
-                    and (self.age[i] < self.last_death_age)): # for i == 1, 2, ..., 10, wd_phase[i] == 0
-                    self.wd_phase[i] = 1
-                else: # wd_phase[40] == 0
-                    self.wd_phase[i] = 0
-                
                 if (i > 1):
-                    if (self.age[i] >= self.last_death_age): # auto_periodic_benefit_status[40] == 0
-                        self.auto_periodic_benefit_status[i] = 0
-                    else:
-                        if ((self.wd_phase[i-1] == 1) and (self.av_post_death_claim[i-1] == 0.0)):
-                            self.auto_periodic_benefit_status[i] = 1
-                        else: # for i == 1, 2, ..., 11, auto_periodic_benefit_status[i] == 0
-                            self.auto_periodic_benefit_status[i] = self.auto_periodic_benefit_status[i-1]
-                
-                if (self.wd_phase[i] == 1):
-                    self.wd_amount[i] = self.wd_rate * self.wd_base[i]
-                else:
-                    if (self.auto_periodic_benefit_status[i] == 1):
-                        self.wd_amount[i] = self.max_annual_wd[i]
-                    else: # for i == 0, 1, ..., 10, wd_amount[i] == 0.0
-                        self.wd_amount[i] = 0.0
-                
-                self.av_post_wd[i] = np.max([0.0, self.av_pre_wd[i]-self.wd_amount[i]])
-
-                if (self.av_post_wd[i] == 0.0):
-                    self.fund1_post_wd[i] = 0.0
-                else:
-                    self.fund1_post_wd[i] = self.fund1_pre_wd[i] * (self.av_post_wd[i] / self.av_pre_wd[i])
-                
-                if (self.av_post_wd[i] == 0.0):
-                    self.fund2_post_wd[i] = 0.0
-                else:
-                    self.fund2_post_wd[i] = self.fund2_pre_wd[i] * (self.av_post_wd[i] / self.av_pre_wd[i])
-                
-                self.rider_charge[i] = self.rider_charge_rate * self.av_post_wd[i]
-
-                self.av_post_charge[i] = self.av_post_wd[i] - self.rider_charge[i]
-
-                if (self.av_post_charge[i] == 0.0):
-                    self.fund1_post_charge[i] = 0.0
-                else:
-                    self.fund1_post_charge[i] = self.fund1_post_wd[i] * (self.av_post_charge[i] / self.av_post_wd[i])
-                
-                if (self.av_post_charge[i] == 0.0):
-                    self.fund2_post_charge[i] = 0.0
-                else:
-                    self.fund2_post_charge[i] = self.fund2_post_wd[i] * (self.av_post_charge[i] / self.av_post_wd[i])
-
-                if (self.growth_phase[i] + self.wd_phase[i] + self.auto_periodic_benefit_status[i] + self.last_death[i] == 0):
-                    self.death_payment[i] = 0.0
-                else:
-                    self.death_payment[i] = np.max([self.death_benefit_base[i-1], self.rop_death_base[i-1]]) * self.qx[i]
-                
-                self.av_post_death_claim[i] = np.max([self.av_post_charge[i] - self.death_payment[i], 0.0])
-
-                if (self.av_post_death_claim[i] == 0.0):
-                    self.fund1_post_death_claim[i] = 0.0
-                else:
-                    self.fund1_post_death_claim[i] = self.fund1_post_charge[i] * (self.av_post_death_claim[i] / self.av_post_charge[i])
-                
-                if (self.av_post_death_claim[i] == 0.0):
-                    self.fund2_post_death_claim[i] = 0.0
-                else:
-                    self.fund2_post_death_claim[i] = self.fund2_post_charge[i] * (self.av_post_death_claim[i] / self.av_post_charge[i])
-                
-                self.rebalance_indicator[i] = self.wd_phase[i] + self.auto_periodic_benefit_status[i]
-
-                if (self.rebalance_indicator[i] == 1):
-                    self.fund1_post_rb[i] = self.av_post_death_claim[i] * self.rb_target
-                else:
-                    self.fund1_post_rb[i] = self.fund1_post_death_claim[i]
-                
-                self.fund2_post_rb[i] = self.av_post_charge[i] - self.fund1_post_rb[i]
-
-                self.rop_death_base[i] = self.rop_death_base[i-1] * (1 - self.qx[i])
-
-                self.nar_death_claim[i] = np.max([0.0, self.death_payment[i] - self.av_post_charge[i]])
-
-                self.death_benefit_base[i] = np.max([0.0,
-                                                self.death_benefit_base[i-1] * (1 - self.qx[i]) + self.contribution[i] - self.m_and_e_fund_fees[i] - self.wd_amount[i-1] - self.rider_charge[i]])
-
-                temp1 = 0.0
-                if (self.growth_phase[i] == 1):
-                    temp1 = self.av_post_death_claim[i]
+                    auto_periodic_benefit_status = np.where(age[..., i] >= last_death_age, 0,
+                                                            np.where((wd_phase_prev == 1) & (av_post_death_claim == 0.0), 1,
+                                                                     auto_periodic_benefit_status))
+
+                # same ordering of the withdrawal base before and after year 10 as in _project
+                wd_base_prev = wd_base
+                wd_amount_prev = wd_amount
+                if (i > 10):
+                    temp2 = np.where(eligible_step_up[..., i] == 1,
+                                     wd_base_prev * survival * (1 + step_up) + contribution[..., i] - m_and_e_fund_fees,
+                                     0.0)
+                    wd_base = np.maximum(np.maximum(0.0, wd_base_prev * survival + contribution[..., i]), temp2)
+                    max_annual_wd = max_annual_wd_rate[..., i] * wd_base
+                    wd_amount = np.where(wd_phase == 1, wd_rate * wd_base,
+                                         np.where(auto_periodic_benefit_status == 1, max_annual_wd, 0.0))
                 else:
-                    temp1 = 0.0
-                temp2 = 0.0
-                if (self.eligible_step_up[i] == 1):
-                    temp2 = self.wd_base[i-1] * (1 - self.qx[i]) * (1 + self.step_up) + self.contribution[i] - self.m_and_e_fund_fees[i] - self.rider_charge[i]
-                else:
-                    temp2 = 0.0
-                self.wd_base[i] = np.max([temp1,
-                                    self.wd_base[i-1] * (1 - self.qx[i]) + self.contribution[i],
-                                    temp2])
-                
-                self.max_annual_wd[i] = self.max_annual_wd_rate[i] * self.wd_base[i]
-
-                self.wd_claim[i] = np.max([self.wd_amount[i] - self.av_post_death_claim[i-1], 0.0])
-            
-            if (i > 10):
-                self.fund1_pre_fee[i] = self.fund1_post_rb[i-1] * (1 + self.fund1_return[i])
-                self.fund2_pre_fee[i] = self.fund2_post_rb[i-1] * (1 + self.fund2_return[i])
-                self.av_pre_fee[i] = self.fund1_pre_fee[i] + self.fund2_pre_fee[i]
-
-                self.m_and_e_fund_fees[i] = self.av_post_death_claim[i-1] * (self.m_and_e + self.fund_fees)
-
-                self.av_pre_wd[i] = np.max([0.0, self.av_pre_fee[i]+self.contribution[i]-self.m_and_e_fund_fees[i]])
-
-                if (self.av_pre_wd[i] == 0.0):
-                    self.fund1_pre_wd[i] = 0.0
-                else:
-                    self.fund1_pre_wd[i] = self.fund1_pre_fee[i] * (self.av_pre_wd[i] / self.av_pre_fee[i])
-                
-                if (self.av_pre_wd[i] == 0.0):
-                    self.fund2_pre_wd[i] = 0.0
-                else:
-                    self.fund2_pre_wd[i] = self.fund2_pre_fee[i] * (self.av_pre_wd[i] / self.av_pre_fee[i])
-                
-                if (((self.age[i] > self.first_wd_age) or (self.age[i] > self.annuity_start_age)) and (self.av_post_death_claim[i-1] > 0.0)
-                    and (self.age[i] < self.last_death_age)): # for i == 1, 2, ..., 10, wd_phase[i] == 0
-                    self.wd_phase[i] = 1
-                else: # wd_phase[40] == 0
-                    self.wd_phase[i] = 0
-                
-                if (i > 1):
-                    if (self.age[i] >= self.last_death_age): # auto_periodic_benefit_status[40] == 0
-                        self.auto_periodic_benefit_status[i] = 0
-                    else:
-                        if ((self.wd_phase[i-1] == 1) and (self.av_post_death_claim[i-1] == 0.0)):
-                            self.auto_periodic_benefit_status[i] = 1
-                        else: # for i == 1, 2, ..., 11, auto_periodic_benefit_status[i] == 0
-                            self.auto_periodic_benefit_status[i] = self.auto_periodic_benefit_status[i-1]
-                
-                temp1 = 0.0
-                if (self.growth_phase[i] == 1):
-                    temp1 = self.av_post_death_claim[i]
-                else:
-                    temp1 = 0.0
-                temp2 = 0.0
-                if (self.eligible_step_up[i] == 1):
-                    temp2 = self.wd_base[i-1] * (1 - self.qx[i]) * (1 + self.step_up) + self.contribution[i] - self.m_and_e_fund_fees[i] - self.rider_charge[i]
-                else:
-                    temp2 = 0.0
-                self.wd_base[i] = np.max([temp1,
-                                    self.wd_base[i-1] * (1 - self.qx[i]) + self.contribution[i],
-                                    temp2])
-                
-                self.max_annual_wd[i] = self.max_annual_wd_rate[i] * self.wd_base[i]
-
-                if (self.wd_phase[i] == 1):
-                    self.wd_amount[i] = self.wd_rate * self.wd_base[i]
-                else:
-                    if (self.auto_periodic_benefit_status[i] == 1):
-                        self.wd_amount[i] = self.max_annual_wd[i]
-                    else: # for i == 0, 1, ..., 10, wd_amount[i] == 0.0
-                        self.wd_amount[i] = 0.0
-                
-                self.av_post_wd[i] = np.max([0.0, self.av_pre_wd[i]-self.wd_amount[i]])
-
-                if (self.av_post_wd[i] == 0.0):
-                    self.fund1_post_wd[i] = 0.0
-                else:
-                    self.fund1_post_wd[i] = self.fund1_pre_wd[i] * (self.av_post_wd[i] / self.av_pre_wd[i])
-                
-                if (self.av_post_wd[i] == 0.0):
-                    self.fund2_post_wd[i] = 0.0
-                else:
-                    self.fund2_post_wd[i] = self.fund2_pre_wd[i] * (self.av_post_wd[i] / self.av_pre_wd[i])
-                
-                self.rider_charge[i] = self.rider_charge_rate * self.av_post_wd[i]
-
-                self.av_post_charge[i] = self.av_post_wd[i] - self.rider_charge[i]
-
-                if (self.av_post_charge[i] == 0.0):
-                    self.fund1_post_charge[i] = 0.0
-                else:
-                    self.fund1_post_charge[i] = self.fund1_post_wd[i] * (self.av_post_charge[i] / self.av_post_wd[i])
-                
-                if (self.av_post_charge[i] == 0.0):
-                    self.fund2_post_charge[i] = 0.0
-                else:
-                    self.fund2_post_charge[i] = self.fund2_post_wd[i] * (self.av_post_charge[i] / self.av_post_wd[i])
-                
-                if (self.growth_phase[i] + self.wd_phase[i] + self.auto_periodic_benefit_status[i] + self.last_death[i] == 0):
-                    self.death_payment[i] = 0.0
-                else:
-                    self.death_payment[i] = np.max([self.death_benefit_base[i-1], self.rop_death_base[i-1]]) * self.qx[i]
-                
-                self.av_post_death_claim[i] = np.max([self.av_post_charge[i] - self.death_payment[i], 0.0])
-
-                if (self.av_post_death_claim[i] == 0.0):
-                    self.fund1_post_death_claim[i] = 0.0
-                else:
-                    self.fund1_post_death_claim[i] = self.fund1_post_charge[i] * (self.av_post_death_claim[i] / self.av_post_charge[i])
-                
-                if (self.av_post_death_claim[i] == 0.0):
-                    self.fund2_post_death_claim[i] = 0.0
-                else:
-                    self.fund2_post_death_claim[i] = self.fund2_post_charge[i] * (self.av_post_death_claim[i] / self.av_post_charge[i])
-                
-                self.rebalance_indicator[i] = self.wd_phase[i] + self.auto_periodic_benefit_status[i]
-
-                if (self.rebalance_indicator[i] == 1):
-                    self.fund1_post_rb[i] = self.av_post_death_claim[i] * self.rb_target
-                else:
-                    self.fund1_post_rb[i] = self.fund1_post_death_claim[i]
-                
-                self.fund2_post_rb[i] = self.av_post_charge[i] - self.fund1_post_rb[i]
-
-                self.rop_death_base[i] = self.rop_death_base[i-1] * (1 - self.qx[i])
-
-                self.nar_death_claim[i] = np.max([0.0, self.death_payment[i] - self.av_post_charge[i]])
-
-                self.death_benefit_base[i] = np.max([0.0,
-                                                self.death_benefit_base[i-1] * (1 - self.qx[i]) + self.contribution[i] - self.m_and_e_fund_fees[i] - self.wd_amount[i-1] - self.rider_charge[i]])
-                
-                self.wd_claim[i] = np.max([self.wd_amount[i] - self.av_post_death_claim[i-1], 0.0])
-
-        self.death_claim = self.nar_death_claim
-
-        self.cumulative_wd[0] = self.wd_amount[0]
-
-        for i in range(self.yrs):
-            if (i > 0):
-                self.cumulative_wd[i] = self.cumulative_wd[i-1] + self.wd_amount[i]
-
-        for i in range(self.yrs):
-            self.pv_db_claim = self.pv_db_claim + self.nar_death_claim[i] * self.df[i]
-
-        for i in range(self.yrs):
-            self.pv_wb_claim = self.pv_wb_claim + self.wd_claim[i] * self.df[i]
-
-        for i in range(self.yrs):
-            self.pv_rc = self.pv_rc + self.rider_charge[i] * self.df[i]
+                    wd_amount = np.zeros(len(active), dtype=value_dtype)
+                probe.lap('bases')
+
+                av_post_wd = np.maximum(0.0, av_pre_wd - wd_amount)
+                fund_post_wd = [_pro_rata(fund, av_post_wd, av_pre_wd) for fund in fund_pre_wd]
+
+                rider_charge = rider_charge_rate * av_post_wd
+
+                av_post_charge = av_post_wd - rider_charge
+                fund_post_charge = [_pro_rata(fund, av_post_charge, av_post_wd) for fund in fund_post_wd]
+
+                death_payment = np.where(growth_phase[..., i] + wd_phase + auto_periodic_benefit_status + last_death[..., i] == 0,
+                                         0.0,
+                                         np.maximum(death_benefit_base, rop_death_base) * qx[..., i])
+
+                av_post_death_claim_prev = av_post_death_claim
+                av_post_death_claim = np.maximum(av_post_charge - death_payment, 0.0)
+                fund_post_death_claim = [_pro_rata(fund, av_post_death_claim, av_post_charge) for fund in fund_post_charge]
+
+                rebalance_indicator = wd_phase + auto_periodic_benefit_status
+                fund_post_rb = [np.where(rebalance_indicator == 1, av_post_death_claim * weight, fund)
+                                for weight, fund in zip(rb_weights[:-1], fund_post_death_claim[:-1])]
+                fund_post_rb = fund_post_rb + [av_post_charge - _total(fund_post_rb)]
+                probe.lap('account')
+
+                rop_death_base = rop_death_base * survival
+
+                nar_death_claim = np.maximum(0.0, death_payment - av_post_charge)
+
+                death_benefit_base = np.maximum(0.0, death_benefit_base * survival + contribution[..., i]
+                                                - m_and_e_fund_fees - wd_amount_prev - rider_charge)
+
+                if (i <= 10):
+                    temp1 = np.where(growth_phase[..., i] == 1, av_post_death_claim, 0.0)
+                    temp2 = np.where(eligible_step_up[..., i] == 1,
+                                     wd_base_prev * survival * (1 + step_up) + contribution[..., i] - m_and_e_fund_fees - rider_charge,
+                                     0.0)
+                    wd_base = np.maximum(np.maximum(temp1, wd_base_prev * survival + contribution[..., i]), temp2)
+                    max_annual_wd = max_annual_wd_rate[..., i] * wd_base
+
+                wd_claim = np.maximum(wd_amount - av_post_death_claim_prev, 0.0)
+                cumulative_wd = cumulative_wd + wd_amount
+                probe.lap('bases')
+
+            if (len(kept) > 0):
+                values = (av_pre_fee, m_and_e_fund_fees, av_pre_wd, av_post_wd,
+                          rider_charge, av_post_charge, death_payment, av_post_death_claim,
+                          rop_death_base, nar_death_claim,
+                          death_benefit_base, wd_base, wd_amount, cumulative_wd, max_annual_wd,
+                          wd_phase, auto_periodic_benefit_status, rebalance_indicator, wd_claim,
+                          fund_pre_fee, fund_pre_wd, fund_post_wd, fund_post_charge, fund_post_death_claim, fund_post_rb)
+                for name, k in kept:
+                    results[name][..., i] = values[k]
+                probe.lap('store')
+
+            pv_db_claim = pv_db_claim + nar_death_claim * df[..., i]
+            pv_wb_claim = pv_wb_claim + wd_claim * df[..., i]
+            pv_rc = pv_rc + rider_charge * df[..., i]
+            probe.lap('pv')
+
+            if (drop_ruined and first_drop <= i < self.yrs - 1):
+                ruined = np.flatnonzero(av_post_charge == 0.0)
+                if (len(ruined) > 0 and len(ruined) >= RUIN_DROP_SHARE * len(active)):
+                    pv_out[:2, active[ruined]] = _ruined_tail(
+                        i + 1, *_rows(ruined, pv_db_claim, pv_wb_claim, wd_phase, auto_periodic_benefit_status,
+                                      wd_base, wd_amount, death_benefit_base, rop_death_base),
+                        age, qx, df, growth_phase, eligible_step_up, last_death, max_annual_wd_rate,
+                        *_rows(ruined, step_up, last_death_age))
+                    pv_out[2, active[ruined]] = pv_rc[ruined]
+
+                    keep = np.flatnonzero(av_post_charge != 0.0)
+                    active = active[keep]
+                    fund_returns = [fund_return[keep] if (fund_return.ndim == 2) else fund_return
+                                    for fund_return in fund_returns]
+                    (fee_rate, wd_rate, rider_charge_rate, step_up,
+                     first_wd_age, annuity_start_age, last_death_age) = _rows(keep, fee_rate, wd_rate, rider_charge_rate,
+                                                                              step_up, first_wd_age, annuity_start_age,
+                                                                              last_death_age)
+                    (av_post_death_claim, wd_phase, auto_periodic_benefit_status,
+                     wd_base, wd_amount, death_benefit_base, rop_death_base, cumulative_wd,
+                     pv_db_claim, pv_wb_claim, pv_rc) = _rows(keep, av_post_death_claim, wd_phase,
+                                                              auto_periodic_benefit_status, wd_base, wd_amount,
+                                                              death_benefit_base, rop_death_base, cumulative_wd,
+                                                              pv_db_claim, pv_wb_claim, pv_rc)
+                    fund_post_rb = [fund[keep] for fund in fund_post_rb]
+                    rb_weights = _rows(keep, *rb_weights)
+                    probe.lap('ruined_tail')
+
+        if (len(active) < n):
+            pv_out[:, active] = pv_db_claim, pv_wb_claim, pv_rc
+            pv_db_claim, pv_wb_claim, pv_rc = pv_out
+        for name in fund_columns:
+            results[name] = results[name].transpose(1, 0, 2)
+        results['pv_db_claim'] = pv_db_claim
+        results['pv_wb_claim'] = pv_wb_claim
+        results['pv_rc'] = pv_rc
+        probe.lap('store')
+        probe.count('projections', n)
+        probe.count('projection_years', n * (self.yrs - first_year))
+        probe.count('ruined_paths', n - len(active) + np.count_nonzero(av_post_death_claim == 0.0))
+        probe.finish('project_funds')
+        return results
 
     def output_to_excel(self):
-        data_cashflow = pd.DataFrame({'Year': self.year,
-                                'Anniversary': self.anniversary,
-                                'Age': self.age,
-                                'Contribution': self.contribution,
-                                'AV_Pre_Fee': self.av_pre_fee,
-                                'Fund1_Pre_Fee': self.fund1_pre_fee,
-                                'Fund2_Pre_Fee': self.fund2_pre_fee,
-                                'M_and_E_Fund_Fees': self.m_and_e_fund_fees,
-                                'AV_Pre_Withdrawal': self.av_pre_wd,
-                                'Fund1_Pre_Withdrawal': self.fund1_pre_wd,
-                                'Fund2_Pre_Withdrawal': self.fund2_pre_wd,
-                                'AV_Post_Withdrawal': self.av_post_wd,
-                                'Fund1_Post_Withdrawal': self.fund1_post_wd,
-                                'Fund2_Post_Withdrawal': self.fund2_post_wd,
-                                'Rider_Charge': self.rider_charge,
-                                'AV_Post_Charge': self.av_post_charge,
-                                'Fund1_Post_Charge': self.fund1_post_charge,
-                                'Fund2_Post_Charge': self.fund2_post_charge,
-                                'Death_Payment': self.death_payment,
-                                'AV_Post_Death_Claim': self.av_post_death_claim,
-                                'Fund1_Post_Death_Claim': self.fund1_post_death_claim,
-                                'Fund2_Post_Death_Claim': self.fund2_post_death_claim,
-                                'Fund1_Post_Rebalance': self.fund1_post_rb,
-                                'Fund2_Post_Rebalance': self.fund2_post_rb,
-                                'ROP_Death_Base': self.rop_death_base,
-                                'NAR_Death_Claim': self.nar_death_claim,
-                                'Death_Benefit_Base': self.death_benefit_base,
-                                'Withdrawal_Base': self.wd_base,
-                                'Withdrawal_Amount': self.wd_amount,
-                                'Cumulative_Withdrawal': self.cumulative_wd,
-                                'Maximum_Annual_Withdrawal': self.max_annual_wd,
-                                'Maximum_Annual_Withdrawal_Rate': self.max_annual_wd_rate,
-                                'Eligible_Step_Up': self.eligible_step_up,
-                                'Growth_Phase': self.growth_phase,
-                                'Withdrawal_Phase': self.wd_phase,
-                                'Automatic_Periodic_Benefit_Status': self.auto_periodic_benefit_status,
-                                'Last_Death': self.last_death,
-                                'Fund1_Return': self.fund1_return,
-                                'Fund2_Return': self.fund2_return,
-                                'Rebalance_Indicator': self.rebalance_indicator,
-                                'DF': self.df,
-                                'qx': self.qx,
-                                'Death_Claim': self.death_claim,
-                                'Withdrawal_Claim': self.wd_claim},
-                                columns=['Year',
-                                         'Anniversary',
-                                         'Age',
-                                         'Contribution',
-                                         'AV_Pre_Fee',
-                                         'Fund1_Pre_Fee',
-                                         'Fund2_Pre_Fee',
-                                         'M_and_E_Fund_Fees',
-                                         'AV_Pre_Withdrawal',
-                                         'Fund1_Pre_Withdrawal',
-                                         'Fund2_Pre_Withdrawal',
-                                         'AV_Post_Withdrawal',
-                                         'Fund1_Post_Withdrawal',
-                                         'Fund2_Post_Withdrawal',
-                                         'Rider_Charge',
-                                         'AV_Post_Charge',
-                                         'Fund1_Post_Charge',
-                                         'Fund2_Post_Charge',
-                                         'Death_Payment',
-                                         'AV_Post_Death_Claim',
-                                         'Fund1_Post_Death_Claim',
-                                         'Fund2_Post_Death_Claim',
-                                         'Fund1_Post_Rebalance',
-                                         'Fund2_Post_Rebalance',
-                                         'ROP_Death_Base',
-                                         'NAR_Death_Claim',
-                                         'Death_Benefit_Base',
-                                         'Withdrawal_Base',
-                                         'Withdrawal_Amount',
-                                         'Cumulative_Withdrawal',
-                                         'Maximum_Annual_Withdrawal',
-                                         'Maximum_Annual_Withdrawal_Rate',
-                                         'Eligible_Step_Up',
-                                         'Growth_Phase',
-                                         'Withdrawal_Phase',
-                                         'Automatic_Periodic_Benefit_Status',
-                                         'Last_Death',
-                                         'Fund1_Return',
-                                         'Fund2_Return',
-                                         'Rebalance_Indicator',
-                                         'DF',
-                                         'qx',
-                                         'Death_Claim',
-                                         'Withdrawal_Claim'])
-        data_pv = pd.DataFrame({'PV_DB_Claim': [self.pv_db_claim],
-                                'PV_WB_Claim': [self.pv_wb_claim],
-                                'PV_RC': [self.pv_rc]},
-                                columns=['PV_DB_Claim',
-                                         'PV_WB_Claim',
-                                         'PV_RC'])
+        probe = self.instrumentation
+        probe.start()
+        data_cashflow = pd.DataFrame({column: getattr(self, name) for column, name in CASHFLOW_COLUMNS},
+                                     columns=[column for column, name in CASHFLOW_COLUMNS])
+        data_pv = pd.DataFrame({column: [getattr(self, name)] for column, name in PV_COLUMNS},
+                               columns=[column for column, name in PV_COLUMNS])
+        probe.lap('excel_frames')
 
         with pd.ExcelWriter('output.xlsx') as writer:
             data_cashflow.to_excel(writer, sheet_name='Cashflow')
             data_pv.to_excel(writer, sheet_name='PV')
+        probe.lap('excel_write')
+        probe.count('excel_rows', len(data_cashflow) + len(data_pv))
+        probe.finish('output_to_excel')
 
 if (__name__ == "__main__"):
     policy_1 = Policy() # instantiation
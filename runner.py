@@ -0,0 +1,162 @@
+import concurrent.futures
+import contextlib
+import logging
+import os
+import statistics
+import time
+
+import numpy as np
+import pandas as pd
+
+from policy import PV_COLUMNS, Policy
+from scenario import ScenarioGenerator
+
+PV_NAMES = [column for column, name in PV_COLUMNS]
+
+logger = logging.getLogger(__name__)
+
+def _pv_sums(results):
+    # PV sums and sums of squares of a project_batch result, one row per PV in PV_NAMES
+    pv = np.array([results[name] for column, name in PV_COLUMNS])
+    return np.column_stack([pv.sum(axis=1), (pv ** 2).sum(axis=1)])
+
+def _project_chunk(policy, generator, start, stop, columns=()):
+    return policy.project_batch(generator.generate(stop - start, start), columns)
+
+def _run_chunk(policy, generator, start, stop):
+    # projects scenarios start, ..., stop - 1 and sends back only the PV sums and sums of squares
+    return _pv_sums(_project_chunk(policy, generator, start, stop))
+
+def _aggregate_chunk(policy, generator, start, stop, aggregator):
+    # projects scenarios start, ..., stop - 1 into a copy of aggregator with no scenarios
+    chunk = aggregator.empty()
+    chunk.push(_project_chunk(policy, generator, start, stop, aggregator.columns))
+    return chunk
+
+def summarize(n, sums):
+    # mean and standard error of each PV from the scenario count and the summed (sum, sum of squares) rows
+    mean = sums[:, 0] / n
+    var = np.maximum(sums[:, 1] - n * mean ** 2, 0.0) / (n - 1) if (n > 1) else np.zeros(len(mean))
+    return pd.DataFrame({'Mean': mean,
+                         'Std_Error': np.sqrt(var / n)},
+                        index=PV_NAMES,
+                        columns=['Mean', 'Std_Error'])
+
+class MonteCarloRunner:
+    # splits a run of n scenarios into chunks of chunk_size and projects them on a process pool
+    #
+    # chunk k always covers the same scenarios of the same generator, so the result does not depend
+    # on the number of workers; max_workers=1 runs in this process
+    #
+    # with a writer from output.py, workers send back the PVs and the writer's columns instead
+    # and each chunk is written as soon as it is done
+
+    def __init__(self, policy=None, generator=None, chunk_size=10000, max_workers=None, writer=None):
+        self.policy = Policy() if (policy is None) else policy
+        self.generator = ScenarioGenerator() if (generator is None) else generator
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.writer = writer
+
+    def chunk_bounds(self, n_scenarios, start=0):
+        return [(lo, min(lo + self.chunk_size, start + n_scenarios))
+                for lo in range(start, start + n_scenarios, self.chunk_size)]
+
+    def _executor(self):
+        # a process pool of max_workers workers, or None to run in this process when max_workers=1
+        if (self.max_workers == 1):
+            return contextlib.nullcontext(None)
+        return concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def run_sums(self, n_scenarios, start=0):
+        # summed (sum, sum of squares) rows of scenarios start, ..., start + n_scenarios - 1
+        with self._executor() as executor:
+            return self._run_sums(executor, n_scenarios, start)
+
+    def _run_sums(self, executor, n_scenarios, start):
+        # run_sums on the workers of executor, or in this process when executor is None
+        bounds = self.chunk_bounds(n_scenarios, start)
+        policies = [self.policy] * len(bounds)
+        generators = [self.generator] * len(bounds)
+        starts = [lo for lo, hi in bounds]
+        stops = [hi for lo, hi in bounds]
+        # map keeps chunk order, so partial sums are added up the same way on every run
+        return self._reduce(map if (executor is None) else executor.map, policies, generators, starts, stops)
+
+    def _reduce(self, map_chunks, policies, generators, starts, stops):
+        if (self.writer is None):
+            return sum(map_chunks(_run_chunk, policies, generators, starts, stops))
+        sums = 0
+        columns = [self.writer.columns] * len(starts)
+        for start, results in zip(starts, map_chunks(_project_chunk, policies, generators, starts, stops, columns)):
+            self.writer.write(start, results)
+            sums = sums + _pv_sums(results)
+        return sums
+
+    def run(self, n_scenarios):
+        # mean and standard error of pv_db_claim, pv_wb_claim and pv_rc over n_scenarios scenarios
+        return summarize(n_scenarios, self.run_sums(n_scenarios))
+
+    def run_aggregate(self, n_scenarios, aggregator, start=0):
+        # pushes scenarios start, ..., start + n_scenarios - 1 into aggregator (an Aggregator from
+        # aggregate.py); every chunk is aggregated by its worker and the partial aggregates are merged
+        # in chunk order
+        bounds = self.chunk_bounds(n_scenarios, start)
+        args = ([self.policy] * len(bounds), [self.generator] * len(bounds),
+                [lo for lo, hi in bounds], [hi for lo, hi in bounds], [aggregator] * len(bounds))
+        with self._executor() as executor:
+            for chunk in (map if (executor is None) else executor.map)(_aggregate_chunk, *args):
+                aggregator.merge(chunk)
+        return aggregator
+
+    def run_to_tolerance(self, rel_tol=None, abs_tol=None, confidence=0.95, batch_size=None,
+                         max_scenarios=1000000, max_seconds=None, targets=PV_NAMES):
+        # runs batches of batch_size scenarios until the confidence interval half-width of every PV in
+        # targets is at most abs_tol, or at most rel_tol times its mean, or a budget runs out
+        # (max_scenarios scenarios or max_seconds seconds); returns the summarize table of the scenarios run
+        #
+        # batch_size defaults to one chunk per worker; batch k covers the same scenarios on every run, so
+        # the result only depends on where the run stopped
+        if (rel_tol is None and abs_tol is None):
+            raise ValueError("run_to_tolerance needs rel_tol or abs_tol")
+        if (max_scenarios < 1):
+            raise ValueError("max_scenarios must be at least 1, not %r" % max_scenarios)
+        if (batch_size is None):
+            batch_size = self.chunk_size * (self.max_workers or os.cpu_count() or 1)
+        if (batch_size < 1):
+            raise ValueError("batch_size must be at least 1, not %r" % batch_size)
+        z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+        started = time.perf_counter()
+        n, sums, batch = 0, 0, 0
+        # one pool serves every batch, so workers start once
+        with self._executor() as executor:
+            while (True):
+                size = min(batch_size, max_scenarios - n)
+                sums = sums + self._run_sums(executor, size, n)
+                n = n + size
+                batch = batch + 1
+
+                table = summarize(n, sums).loc[targets]
+                half_width = z * table['Std_Error']
+                tolerance = np.inf if (abs_tol is None) else abs_tol
+                if (rel_tol is not None):
+                    tolerance = np.minimum(tolerance, rel_tol * table['Mean'].abs())
+                elapsed = time.perf_counter() - started
+                # a PV with a zero mean (no death benefit, say) has no relative half-width
+                logger.info("batch %d: %d scenarios, %.1f s, half-width %s", batch, n, elapsed,
+                            ", ".join("%s %.6g (%s)" % (name, half_width[name],
+                                                        "%.3g%%" % (100 * half_width[name] / abs(table['Mean'][name]))
+                                                        if (table['Mean'][name] != 0) else "n/a")
+                                      for name in targets))
+
+                if (n > 1 and (half_width <= tolerance).all()):
+                    logger.info("converged after %d scenarios", n)
+                    break
+                if (n >= max_scenarios or (max_seconds is not None and elapsed >= max_seconds)):
+                    logger.warning("stopped at the budget of %d scenarios, %.1f s before reaching the tolerance", n, elapsed)
+                    break
+        return summarize(n, sums)
+
+if (__name__ == "__main__"):
+    runner = MonteCarloRunner(generator=ScenarioGenerator(seed=2016))
+    print(runner.run(100000))
@@ -0,0 +1,131 @@
+import os
+
+import numpy as np
+
+from policy import Policy
+
+def lognormal_returns(z, risk_free_rate, volatility):
+    # fund2_return paths, shape (n_scenarios, yrs), from standard normal shocks z of shape (n_scenarios, yrs - 1);
+    # leading axes of z and of volatility are broadcast against each other
+    growth = np.exp(np.log(1+risk_free_rate)-0.5*(volatility**2)+volatility*z) - 1
+    fund2_return = np.zeros(growth.shape[:-1] + (growth.shape[-1] + 1,))
+    fund2_return[..., 1:] = growth
+    return fund2_return
+
+class ScenarioGenerator:
+    # builds (n_scenarios, yrs) blocks of lognormal fund2_return paths, index 0 not relevant
+    #
+    # scenarios are grouped in blocks of block_size paths and every block draws from its own
+    # SeedSequence-spawned stream, so scenario k is the same however the run is chunked
+
+    def __init__(self, seed=None, risk_free_rate=Policy.risk_free_rate, volatility=Policy.volatility,
+                 yrs=Policy.yrs, block_size=1024):
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.risk_free_rate = risk_free_rate
+        self.volatility = volatility
+        self.yrs = yrs
+        self.block_size = block_size
+        self.shock_shape = (yrs - 1,)
+
+    def stream(self, block):
+        # the numpy.random.Generator drawing the shocks of block, also used by variance.py for other streams of the seed;
+        # same stream as self.seed_sequence.spawn(block + 1)[block], without spawning the others
+        seed_sequence = np.random.SeedSequence(self.seed_sequence.entropy,
+                                               spawn_key=self.seed_sequence.spawn_key + (block,))
+        return np.random.default_rng(seed_sequence)
+
+    def normals(self, start, stop):
+        # standard normal shocks of scenarios start, ..., stop - 1, shape (stop - start,) + self.shock_shape
+        z = np.empty((stop - start,) + self.shock_shape)
+        first_block = start // self.block_size
+        last_block = (stop - 1) // self.block_size
+        for block in range(first_block, last_block + 1):
+            block_start = block * self.block_size
+            draws = self.stream(block).standard_normal((self.block_size,) + self.shock_shape)
+            lo = max(start, block_start)
+            hi = min(stop, block_start + self.block_size)
+            z[lo - start:hi - start] = draws[lo - block_start:hi - block_start]
+        return z
+
+    def returns(self, z):
+        # lognormal fund2_return paths from standard normal shocks z, shape (n_scenarios, yrs - 1)
+        return lognormal_returns(z, self.risk_free_rate, self.volatility)
+
+    def generate(self, n_scenarios, start=0):
+        # fund2_return of scenarios start, ..., start + n_scenarios - 1
+        return self.returns(self.normals(start, start + n_scenarios))
+
+    def chunks(self, n_scenarios, chunk_size, start=0):
+        # yields (first scenario, fund2_return) pairs of at most chunk_size scenarios each,
+        # so only one chunk is held in memory at a time
+        for lo in range(start, start + n_scenarios, chunk_size):
+            hi = min(lo + chunk_size, start + n_scenarios)
+            yield lo, self.generate(hi - lo, lo)
+
+class MultiFundGenerator(ScenarioGenerator):
+    # builds (n_scenarios, n_funds, yrs) blocks of correlated lognormal fund return paths, index 0 not relevant,
+    # for MultiFundPolicy
+    #
+    # volatility holds one value per fund and correlation is the n_funds x n_funds correlation matrix of
+    # the funds' annual log returns (independent funds if None); every fund earns risk_free_rate on average
+    #
+    # each scenario draws one (yrs - 1, n_funds) block of independent shocks, correlated by the Cholesky
+    # factor of correlation, from the same per-block streams as ScenarioGenerator
+
+    def __init__(self, volatility, correlation=None, seed=None, risk_free_rate=Policy.risk_free_rate,
+                 yrs=Policy.yrs, block_size=1024):
+        volatility = np.asarray(volatility, dtype=float)
+        if (volatility.ndim != 1):
+            raise ValueError("volatility must hold one value per fund")
+        correlation = np.eye(len(volatility)) if (correlation is None) else np.asarray(correlation, dtype=float)
+        if (correlation.shape != (len(volatility), len(volatility))):
+            raise ValueError("correlation must have shape (%d, %d)" % (len(volatility), len(volatility)))
+        ScenarioGenerator.__init__(self, seed, risk_free_rate, volatility, yrs, block_size)
+        self.correlation = correlation
+        self.cholesky = np.linalg.cholesky(correlation)
+        self.shock_shape = (yrs - 1, len(volatility))
+
+    def returns(self, z):
+        # fund return paths from standard normal shocks z, shape (n_scenarios, yrs - 1, n_funds)
+        shocks = np.swapaxes(z @ self.cholesky.T, 1, 2)
+        return lognormal_returns(shocks, self.risk_free_rate, self.volatility[:, np.newaxis])
+
+class ScenarioBank:
+    # fund2_return paths read from a scenario file, one path of yrs values per row, index 0 not relevant
+    #
+    # .npy files and raw float64 files (row-major, no header) are memory-mapped, so slices are views
+    # on the file and worker processes reopen the file instead of receiving a copy of the bank
+
+    def __init__(self, path, yrs=Policy.yrs):
+        self.path = path
+        self.yrs = yrs
+        if (path.endswith('.npy')):
+            self.paths = np.load(path, mmap_mode='r')
+        else:
+            size = os.path.getsize(path)
+            if (size % (8 * yrs) != 0):
+                raise ValueError("%s holds %d bytes, not a whole number of %d-year float64 paths" % (path, size, yrs))
+            self.paths = np.memmap(path, dtype=np.float64, mode='r', shape=(size // (8 * yrs), yrs))
+        if (self.paths.ndim != 2 or self.paths.shape[1] != yrs):
+            raise ValueError("%s has shape %s, expected (n_scenarios, %d)" % (path, self.paths.shape, yrs))
+
+    def __len__(self):
+        return self.paths.shape[0]
+
+    def __getstate__(self):
+        return {'path': self.path, 'yrs': self.yrs}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['yrs'])
+
+    def generate(self, n_scenarios, start=0):
+        # fund2_return of scenarios start, ..., start + n_scenarios - 1, a read-only view on the file,
+        # so a bank can stand in for a ScenarioGenerator
+        if (start < 0 or start + n_scenarios > len(self)):
+            raise IndexError("scenarios %d to %d are outside the bank of %d" % (start, start + n_scenarios - 1, len(self)))
+        return self.paths[start:start + n_scenarios]
+
+    def chunks(self, n_scenarios, chunk_size, start=0):
+        for lo in range(start, start + n_scenarios, chunk_size):
+            hi = min(lo + chunk_size, start + n_scenarios)
+            yield lo, self.generate(hi - lo, lo)
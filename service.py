@@ -0,0 +1,322 @@
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import copy
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from inforce import PER_POLICY
+from policy import PV_COLUMNS, Policy
+from scenario import ScenarioGenerator, lognormal_returns
+from sweep import grid_points
+
+# quotes arriving within this many seconds of the first one waiting are priced in one projection
+BATCH_WINDOW = 0.002
+
+# most quotes in one projection
+MAX_BATCH = 64
+
+# latencies (and arrival and finish times) kept for the percentiles and throughput of stats
+LATENCY_WINDOW = 10000
+
+# (risk_free_rate, volatility) pairs whose fund2_return paths are kept in memory
+RETURNS_CACHE_SIZE = 32
+
+# (lowest, highest) value of the parameters of a quote, None for no bound; ages are checked against
+# last_death_age and each other in check_contract
+PARAM_BOUNDS = {'step_up': (0.0, 1.0),
+                'step_up_period': (0.0, None),
+                'rider_charge_rate': (0.0, 1.0),
+                'initial_premium': (0.0, None),
+                'last_death_age': (1.0, 150.0),
+                'mortality': (0.0, 1.0),
+                'wd_rate': (0.0, 1.0),
+                'rb_target': (0.0, 1.0),
+                'm_and_e': (0.0, 1.0),
+                'fund_fees': (0.0, 1.0),
+                'risk_free_rate': (-0.5, 1.0),
+                'volatility': (0.0, None),
+                'maw_rate1': (0.0, 1.0),
+                'maw_rate2': (0.0, 1.0),
+                'maw_rate3': (0.0, 1.0),
+                'maw_rate4': (0.0, 1.0),
+                'fund1_pre_fee_initial': (0.0, 1.0),
+                'fund2_pre_fee_initial': (0.0, 1.0)}
+
+AGE_PARAMS = ['start_age', 'first_wd_age', 'annuity_start_age', 'maw_age1', 'maw_age2', 'maw_age3', 'maw_age4']
+
+def check_contract(contract):
+    # raises ValueError unless the contract of contract (a dict of every one of PER_POLICY) is one the
+    # model can value: every value within PARAM_BOUNDS, ages within [0, last_death_age], a start age
+    # before the last death age and no later than the first withdrawal and annuity start ages, and a
+    # fund split adding up to at most 1
+    errors = []
+    for name, (lowest, highest) in PARAM_BOUNDS.items():
+        if ((lowest is not None and contract[name] < lowest) or (highest is not None and contract[name] > highest)):
+            errors.append("%s must be in [%s, %s], not %g" % (name, lowest, '' if (highest is None) else highest, contract[name]))
+    for name in AGE_PARAMS:
+        if (not (0 <= contract[name] <= contract['last_death_age'])):
+            errors.append("%s must be in [0, last_death_age = %g], not %g" % (name, contract['last_death_age'], contract[name]))
+    if (contract['start_age'] >= contract['last_death_age']):
+        errors.append("start_age must be below last_death_age")
+    for name in ['first_wd_age', 'annuity_start_age']:
+        if (contract[name] < contract['start_age']):
+            errors.append("%s must be at least start_age = %g, not %g" % (name, contract['start_age'], contract[name]))
+    if (contract['fund1_pre_fee_initial'] + contract['fund2_pre_fee_initial'] > 1):
+        errors.append("fund1_pre_fee_initial + fund2_pre_fee_initial must be at most 1")
+    if (len(errors) > 0):
+        raise ValueError("; ".join(errors))
+
+class PricingService:
+    # prices single contracts on a fixed scenario set, many quotes per batched projection
+    #
+    # the shocks of n_scenarios scenarios of generator stay in memory, with the fund2_return paths they
+    # give for the latest RETURNS_CACHE_SIZE pairs of risk_free_rate and volatility; quotes that arrive
+    # while a projection runs, or within window seconds of the first one waiting, are valued in one
+    # batched projection, with every parameter that differs between them as a per-row array as in
+    # inforce.py, on a thread of its own so the event loop keeps taking requests
+    #
+    # a quote gives any of PER_POLICY (the rest are those of policy) and gets back the mean pv_db_claim,
+    # pv_wb_claim and pv_rc over the scenarios; stats reports latencies and throughput
+    #
+    # quotes outside the model's domain (see check_contract) are rejected before they are queued, and a
+    # batch whose projection fails anyway is priced again one quote at a time, so a bad quote fails alone
+
+    def __init__(self, n_scenarios=1000, policy=None, generator=None, window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.policy = Policy() if (policy is None) else policy
+        generator = ScenarioGenerator() if (generator is None) else generator
+        self.z = generator.normals(0, n_scenarios)
+        self.returns = collections.OrderedDict()
+        self.window = window
+        self.max_batch = max_batch
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.queue = None
+        self.task = None
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.times = collections.deque(maxlen=LATENCY_WINDOW)
+        self.quotes = 0
+        self.errors = 0
+        self.rejected = 0
+        self.batches = 0
+
+    def fund2_return(self, risk_free_rate, volatility):
+        key = (float(risk_free_rate), float(volatility))
+        if (key in self.returns):
+            self.returns.move_to_end(key)
+        else:
+            self.returns[key] = lognormal_returns(self.z, *key)
+            if (len(self.returns) > RETURNS_CACHE_SIZE):
+                self.returns.popitem(last=False)
+        return self.returns[key]
+
+    def price(self, quotes):
+        # mean PVs of every quote (a dict of contract parameters), shape (len(quotes), len(PV_COLUMNS))
+        #
+        # row q * n_scenarios + k is scenario k of quote q; a parameter shared by every quote stays a
+        # scalar, so a batch of quotes of the same ages also shares the memoized schedule
+        points = grid_points(pd.DataFrame(list(quotes)))
+        n = self.z.shape[0]
+        contract = copy.copy(self.policy)
+        for name in points.columns:
+            values = points[name].fillna(getattr(self.policy, name)).to_numpy(dtype=float)
+            if (np.all(values == values[0])):
+                setattr(contract, name, values[0].item())
+            else:
+                setattr(contract, name, np.repeat(values, n))
+        rates = np.broadcast_to(np.asarray(contract.risk_free_rate, dtype=float), (len(points) * n,))[::n]
+        volatilities = np.broadcast_to(np.asarray(contract.volatility, dtype=float), (len(points) * n,))[::n]
+        fund2_return = np.concatenate([self.fund2_return(rate, volatility) for rate, volatility in zip(rates, volatilities)])
+        results = contract.project_batch(fund2_return)
+        pv = np.column_stack([results[name] for column, name in PV_COLUMNS])
+        return pv.reshape(len(points), n, len(PV_COLUMNS)).mean(axis=1)
+
+    async def start(self):
+        # starts batching and warms the engine with a quote of policy as it is
+        self.queue = asyncio.Queue()
+        self.task = asyncio.get_running_loop().create_task(self._batches())
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.price, [{}])
+        return self
+
+    async def close(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.executor.shutdown()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def quote(self, params):
+        # dict of the mean pv_db_claim, pv_wb_claim and pv_rc of the contract of params; params that are
+        # not finite numbers, or give a contract outside the model's domain, are rejected here, before
+        # they reach a batch
+        try:
+            params = self._checked(params)
+        except ValueError:
+            self.rejected += 1
+            raise
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((params, future, time.perf_counter()))
+        return await future
+
+    def _checked(self, params):
+        # params as floats, or ValueError
+        if (not isinstance(params, dict)):
+            raise ValueError("params must be an object of contract parameters")
+        grid_points(pd.DataFrame(columns=list(params)))
+        values = {}
+        for name, value in params.items():
+            try:
+                values[name] = float(value)
+            except (TypeError, ValueError):
+                raise ValueError("%s must be a number, not %r" % (name, value)) from None
+            if (not np.isfinite(values[name])):
+                raise ValueError("%s must be finite, not %r" % (name, value))
+        check_contract({name: values.get(name, getattr(self.policy, name)) for name in PER_POLICY})
+        return values
+
+    async def _batches(self):
+        loop = asyncio.get_running_loop()
+        while (True):
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.window
+            while (len(batch) < self.max_batch):
+                if (not self.queue.empty()):
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if (timeout <= 0):
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                values = list(await loop.run_in_executor(self.executor, self.price, [params for params, future, arrived in batch]))
+            except Exception as error:
+                values = [error]
+                if (len(batch) > 1):
+                    values = []
+                    for params, future, arrived in batch:
+                        try:
+                            values.append((await loop.run_in_executor(self.executor, self.price, [params]))[0])
+                        except Exception as error:
+                            values.append(error)
+            finished = time.perf_counter()
+            for (params, future, arrived), pv in zip(batch, values):
+                if (isinstance(pv, Exception)):
+                    self.errors += 1
+                    if (not future.done()):
+                        future.set_exception(pv)
+                elif (not future.done()):
+                    future.set_result(dict(zip([name for column, name in PV_COLUMNS], pv.tolist())))
+                self.latencies.append(finished - arrived)
+                self.times.append((arrived, finished))
+            self.quotes += len(batch)
+            self.batches += 1
+
+    def stats(self):
+        # quotes and batches priced (a quote whose pricing failed counts, and also as one of errors), quotes
+        # rejected before pricing, and over the last LATENCY_WINDOW quotes priced the quotes per second from
+        # the first arrival to the last finish (so idle time before and after does not count) and the 50th,
+        # 90th, 99th percentile and largest latency in milliseconds
+        span = 0.0
+        if (len(self.times) > 0):
+            span = max(finished for arrived, finished in self.times) - min(arrived for arrived, finished in self.times)
+        table = {'quotes': self.quotes,
+                 'errors': self.errors,
+                 'rejected': self.rejected,
+                 'batches': self.batches,
+                 'mean_batch': self.quotes / self.batches if (self.batches > 0) else 0.0,
+                 'quotes_per_second': len(self.times) / span if (span > 0) else 0.0}
+        latencies = 1000 * np.array(self.latencies)
+        for label, q in [('p50_ms', 50), ('p90_ms', 90), ('p99_ms', 99), ('max_ms', 100)]:
+            table[label] = float(np.percentile(latencies, q)) if (len(latencies) > 0) else 0.0
+        return table
+
+    async def handle(self, reader, writer):
+        # one JSON request per line: {"id": ..., "params": {...}} gets {"id": ..., "pv_db_claim": ..., ...}
+        # back, or {"id": ..., "error": ...}; {"stats": true} gets stats
+        pending = set()
+
+        async def answer(request):
+            try:
+                reply = dict(await self.quote(request.get('params', {})), id=request.get('id'))
+            except Exception as error:
+                reply = {'id': request.get('id'), 'error': str(error)}
+            writer.write((json.dumps(reply) + '\n').encode())
+
+        try:
+            while (True):
+                line = await reader.readline()
+                if (not line):
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError as error:
+                    writer.write((json.dumps({'error': str(error)}) + '\n').encode())
+                    continue
+                if (not isinstance(request, dict)):
+                    writer.write((json.dumps({'error': "a request must be a JSON object"}) + '\n').encode())
+                    continue
+                if (request.get('stats')):
+                    writer.write((json.dumps(self.stats()) + '\n').encode())
+                    continue
+                task = asyncio.get_running_loop().create_task(answer(request))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if (len(pending) > 0):
+                await asyncio.wait(pending)
+            await writer.drain()
+        finally:
+            writer.close()
+
+async def serve(host='127.0.0.1', port=8765, **kwargs):
+    async with PricingService(**kwargs) as service:
+        server = await asyncio.start_server(service.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+async def load_test(service, n_quotes, concurrency, seed=0):
+    # sends n_quotes quotes of random ages and rider charges, at most concurrency at a time, and
+    # returns the stats of service
+    rng = np.random.default_rng(seed)
+    start_age = rng.integers(50, 71, n_quotes)
+    quotes = [{'start_age': int(age), 'first_wd_age': int(age) + int(rng.integers(0, 11)),
+               'rider_charge_rate': float(rng.choice([0.0075, 0.0085, 0.0095]))} for age in start_age]
+    limit = asyncio.Semaphore(concurrency)
+
+    async def client(params):
+        async with limit:
+            return await service.quote(params)
+
+    await asyncio.gather(*[client(params) for params in quotes])
+    return service.stats()
+
+if (__name__ == "__main__"):
+    parser = argparse.ArgumentParser(description="serve quotes over local TCP, one JSON request per line")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--scenarios', type=int, default=1000)
+    parser.add_argument('--window', type=float, default=BATCH_WINDOW)
+    parser.add_argument('--load-test', type=int, metavar='N', help="price N random quotes in process and print stats")
+    parser.add_argument('--concurrency', type=int, default=100)
+    args = parser.parse_args()
+
+    if (args.load_test is not None):
+        async def main():
+            async with PricingService(args.scenarios, window=args.window) as service:
+                print(await load_test(service, args.load_test, args.concurrency))
+        asyncio.run(main())
+    else:
+        asyncio.run(serve(args.host, args.port, n_scenarios=args.scenarios, window=args.window))
@@ -0,0 +1,338 @@
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from inforce import InForce, PER_POLICY
+from output import COLUMN_HEADERS
+from policy import KERNEL_FIELDS, PV_COLUMNS, Policy
+from runner import summarize
+from scenario import ScenarioGenerator
+
+JOB_FILE = 'job.json'
+INFORCE_FILE = 'inforce.csv'
+
+# a claim not refreshed for this many seconds is taken to belong to a crashed worker, and the shard
+# may be claimed again; a worker refreshes its claim after every batch of the shard it runs, and a claim
+# of a process of this host that is no longer running is stale at once
+STALE_CLAIM_SECONDS = 6 * 3600
+
+# claim files of the shards that this process is running
+_running = set()
+
+def _write_atomic(path, write):
+    # write(f) into a temporary file renamed to path once complete, so path is never seen half written;
+    # the temporary name is unique across hosts, processes and threads sharing the directory
+    temporary = '%s.%s.%d.%s.tmp' % (path, socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+    try:
+        with open(temporary, 'xb') as f:
+            write(f)
+        os.replace(temporary, path)
+    finally:
+        if (os.path.exists(temporary)):
+            os.remove(temporary)
+
+def _pid_running(pid):
+    # True unless process pid of this host is known to have ended
+    if (sys.platform == 'win32'):
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+        if (not handle):
+            return False
+        code = ctypes.c_ulong()
+        ctypes.windll.kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return code.value == 259
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _claim_dead(path):
+    # True if the claim file at path belongs to a process of this host that is no longer running it: a
+    # process that has ended, or this process when it is not running the shard
+    try:
+        with open(path) as f:
+            owner = f.read().split()
+    except FileNotFoundError:
+        return False
+    if (len(owner) != 2 or owner[0] != socket.gethostname() or not owner[1].isdigit()):
+        return False
+    pid = int(owner[1])
+    if (pid == os.getpid()):
+        return path not in _running
+    return not _pid_running(pid)
+
+def _shard_pvs(contracts, fund2_return, columns, chunk_size, progress=None):
+    # the PVs of every scenario of fund2_return summed over contracts (a Policy, or an InForce whose contracts
+    # all run on every scenario), shape (len(PV_COLUMNS), n_scenarios), and the sums over scenarios and
+    # contracts of every year of columns, shape (len(columns), yrs)
+    #
+    # a batch holds about chunk_size (contract, scenario) rows, and at least one scenario of every contract;
+    # progress, if given, is called after every batch
+    n_contracts = len(contracts) if (isinstance(contracts, InForce)) else 1
+    per_batch = max(1, chunk_size // n_contracts)
+    pv = []
+    year_sums = np.zeros((len(columns), contracts.yrs))
+    for lo in range(0, len(fund2_return), per_batch):
+        hi = min(lo + per_batch, len(fund2_return))
+        if (isinstance(contracts, InForce)):
+            batch = contracts.subset(np.tile(np.arange(n_contracts), hi - lo))
+            results = batch.project_batch(np.repeat(fund2_return[lo:hi], n_contracts, axis=0), columns)
+        else:
+            results = contracts.project_batch(fund2_return[lo:hi], columns)
+        batch_pv = np.array([results[name] for column, name in PV_COLUMNS])
+        pv.append(batch_pv.reshape(len(PV_COLUMNS), hi - lo, n_contracts).sum(axis=2))
+        for k, name in enumerate(columns):
+            year_sums[k] += results[name].sum(axis=0)
+        if (progress is not None):
+            progress()
+    return np.concatenate(pv, axis=1), year_sums
+
+class ShardedRun:
+    # a stochastic run kept in directory, split into shards that any process on any machine sharing the
+    # directory can run, in any order and any number of times
+    #
+    # the job (job.json, plus inforce.csv for an in-force block) fixes the policy, the scenario generator's
+    # seed and the shard sizes; shard k covers scenarios s * scenario_shard_size, ... of that seed
+    # (ScenarioGenerator draws scenario j the same way whatever the chunking) and, for an in-force block,
+    # contracts p * policy_shard_size, ..., with k = s * n_policy_shards + p
+    #
+    # a finished shard is checkpointed as shard_<k>.npz, holding the sums and sums of squares of its PVs and
+    # the per-year sums of columns (and the PVs of each scenario when the in-force block is split, as block
+    # variances need every contract of a scenario first); shards are claimed through shard_<k>.claim.<g>
+    # files, so workers on several machines do not run the same shard; a rerun after a crash runs the shards
+    # without a partial file, except those claimed by a live worker (on another host, one whose claim was
+    # refreshed within stale_after)
+    #
+    # merge adds up any set of partial files in shard order: with scenario_shard_size equal to the
+    # chunk_size of a MonteCarloRunner, and every shard projected in one batch (chunk_size of run at least
+    # scenario_shard_size) as the runner projects a chunk, the sums of a policy are those of
+    # MonteCarloRunner.run_sums; smaller batches can change the last bits, as paths whose account ran out
+    # switch to their closed-form tail at a year that depends on the batch
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, JOB_FILE)) as f:
+            self.job = json.load(f)
+        self.columns = self.job['columns']
+        self.n_scenarios = self.job['n_scenarios']
+        self.scenario_shard_size = self.job['scenario_shard_size']
+        self.n_scenario_shards = -(-self.n_scenarios // self.scenario_shard_size)
+        if (self.job['n_policies'] is None):
+            self.n_policy_shards = 1
+        else:
+            self.n_policy_shards = -(-self.job['n_policies'] // self.job['policy_shard_size'])
+
+    @classmethod
+    def create(cls, directory, n_scenarios, scenario_shard_size, params=None, generator=None, inforce=None,
+               policy_shard_size=None, columns=()):
+        # writes the job of a run of n_scenarios scenarios of generator to directory and returns the run
+        #
+        # params overrides Policy class attributes (any of PER_POLICY) for the whole run; inforce is an
+        # InForce block valued on every scenario instead, split into shards of policy_shard_size contracts
+        # (all in one shard by default), whose contracts take params for the attributes it has no column of;
+        # columns names the per-year arrays (any of KERNEL_FIELDS) to sum
+        params = {} if (params is None) else dict(params)
+        unknown = [name for name in params if (name not in PER_POLICY)]
+        if (len(unknown) > 0):
+            raise ValueError("unknown policy parameters: %s" % ", ".join(unknown))
+        unknown = [name for name in columns if (name not in KERNEL_FIELDS)]
+        if (len(unknown) > 0):
+            raise ValueError("unknown columns: %s" % ", ".join(unknown))
+        generator = ScenarioGenerator() if (generator is None) else generator
+
+        os.makedirs(directory, exist_ok=True)
+        if (os.path.exists(os.path.join(directory, JOB_FILE))):
+            raise ValueError("%s already holds a job" % directory)
+        n_policies = None
+        if (inforce is not None):
+            n_policies = len(inforce)
+            policy_shard_size = n_policies if (policy_shard_size is None) else policy_shard_size
+            _write_atomic(os.path.join(directory, INFORCE_FILE),
+                          lambda f: f.write(inforce.table.to_csv(index=False).encode()))
+        job = {'n_scenarios': n_scenarios,
+               'scenario_shard_size': scenario_shard_size,
+               'n_policies': n_policies,
+               'policy_shard_size': policy_shard_size,
+               'params': {name: np.asarray(value).item() for name, value in params.items()},
+               'columns': list(columns),
+               'generator': {'entropy': generator.seed_sequence.entropy,
+                             'spawn_key': list(generator.seed_sequence.spawn_key),
+                             'risk_free_rate': float(generator.risk_free_rate),
+                             'volatility': float(generator.volatility),
+                             'yrs': generator.yrs,
+                             'block_size': generator.block_size}}
+        _write_atomic(os.path.join(directory, JOB_FILE), lambda f: f.write(json.dumps(job, indent=2).encode()))
+        return cls(directory)
+
+    def __len__(self):
+        return self.n_scenario_shards * self.n_policy_shards
+
+    def bounds(self, shard):
+        # (first scenario, last scenario + 1, first contract, last contract + 1) of shard
+        s, p = divmod(shard, self.n_policy_shards)
+        lo = s * self.scenario_shard_size
+        hi = min(lo + self.scenario_shard_size, self.n_scenarios)
+        if (self.job['n_policies'] is None):
+            return lo, hi, 0, 1
+        first = p * self.job['policy_shard_size']
+        return lo, hi, first, min(first + self.job['policy_shard_size'], self.job['n_policies'])
+
+    def generator(self):
+        settings = self.job['generator']
+        generator = ScenarioGenerator(None, settings['risk_free_rate'], settings['volatility'],
+                                      settings['yrs'], settings['block_size'])
+        generator.seed_sequence = np.random.SeedSequence(settings['entropy'], spawn_key=tuple(settings['spawn_key']))
+        return generator
+
+    def contracts(self, first=None, last=None):
+        # the Policy of the run, or contracts first, ..., last - 1 of its in-force block
+        if (self.job['n_policies'] is not None):
+            table = pd.read_csv(os.path.join(self.directory, INFORCE_FILE)).iloc[first:last]
+            return InForce(table.assign(**{name: value for name, value in self.job['params'].items()
+                                           if (name not in table.columns)}))
+        policy = Policy()
+        for name, value in self.job['params'].items():
+            setattr(policy, name, value)
+        return policy
+
+    def partial_path(self, shard):
+        return os.path.join(self.directory, 'shard_%06d.npz' % shard)
+
+    def done(self):
+        # shards with a partial file
+        return [k for k in range(len(self)) if (os.path.exists(self.partial_path(k)))]
+
+    def pending(self):
+        # shards without a partial file
+        return [k for k in range(len(self)) if (not os.path.exists(self.partial_path(k)))]
+
+    def run_shard(self, shard, chunk_size=10000, claim=None):
+        # runs shard and writes its partial file, refreshing claim (a path from self.claim) after every batch
+        lo, hi, first, last = self.bounds(shard)
+        progress = None if (claim is None) else (lambda: os.utime(claim))
+        _running.add(claim)
+        try:
+            pv, year_sums = _shard_pvs(self.contracts(first, last), self.generator().generate(hi - lo, lo),
+                                       self.columns, chunk_size, progress)
+        finally:
+            _running.discard(claim)
+        arrays = {'bounds': np.array([lo, hi, first, last]),
+                  'sums': np.column_stack([pv.sum(axis=1), (pv ** 2).sum(axis=1)]),
+                  'year_sums': year_sums}
+        if (self.n_policy_shards > 1):
+            arrays['pv'] = pv
+        _write_atomic(self.partial_path(shard), lambda f: np.savez(f, **arrays))
+
+    def claim(self, shard, stale_after=STALE_CLAIM_SECONDS):
+        # path of the claim file of this process if it may run shard, or None when shard has a partial
+        # file or a live claim of another worker
+        #
+        # claim g of shard is the file shard_<k>.claim.<g>, created with O_EXCL so exactly one worker gets
+        # it, holding the host and pid of that worker; a stale claim g (see STALE_CLAIM_SECONDS) is taken
+        # over by creating claim g + 1, so two workers finding it stale at once cannot both take it
+        if (os.path.exists(self.partial_path(shard))):
+            return None
+        prefix = 'shard_%06d.claim.' % shard
+        claims = [int(name[len(prefix):]) for name in os.listdir(self.directory)
+                  if (name.startswith(prefix) and name[len(prefix):].isdigit())]
+        generation = 0
+        if (len(claims) > 0):
+            generation = max(claims)
+            current = os.path.join(self.directory, prefix + str(generation))
+            try:
+                if (time.time() - os.path.getmtime(current) < stale_after and not _claim_dead(current)):
+                    return None
+            except FileNotFoundError:
+                return None
+            generation = generation + 1
+        path = os.path.join(self.directory, prefix + str(generation))
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return None
+        with os.fdopen(fd, 'w') as f:
+            f.write('%s %d\n' % (socket.gethostname(), os.getpid()))
+        return path
+
+    def run(self, shards=None, chunk_size=10000, stale_after=STALE_CLAIM_SECONDS):
+        # runs every shard of shards (all of them by default) that this worker can claim, in order;
+        # several workers can call run on the same directory at once
+        shards = range(len(self)) if (shards is None) else shards
+        ran = []
+        for shard in shards:
+            claim = self.claim(shard, stale_after)
+            if (claim is not None):
+                self.run_shard(shard, chunk_size, claim)
+                ran.append(shard)
+        return ran
+
+    def merge(self, shards=None):
+        # (n_scenarios, sums, year_sums) of the partial files of shards (all done shards by default), with
+        # sums the (sum, sum of squares) rows of each PV as in MonteCarloRunner.run_sums
+        #
+        # the PVs of the contracts of one scenario add up across the shards of an in-force block split
+        # into several, so the totals of a scenario are those of the contracts whose shards are merged
+        shards = sorted(self.done() if (shards is None) else shards)
+        missing = [k for k in shards if (not os.path.exists(self.partial_path(k)))]
+        if (len(missing) > 0):
+            raise ValueError("shards not run yet: %s" % ", ".join(str(k) for k in missing))
+
+        n, sums = 0, 0
+        year_sums = np.zeros((len(self.columns), self.job['generator']['yrs']))
+        scenario_pv = {}
+        for shard in shards:
+            with np.load(self.partial_path(shard)) as partial:
+                year_sums = year_sums + partial['year_sums']
+                if (self.n_policy_shards == 1):
+                    lo, hi = partial['bounds'][:2]
+                    n = n + int(hi - lo)
+                    sums = sums + partial['sums']
+                else:
+                    s = shard // self.n_policy_shards
+                    scenario_pv[s] = scenario_pv.get(s, 0) + partial['pv']
+        for s in sorted(scenario_pv):
+            pv = scenario_pv[s]
+            n = n + pv.shape[1]
+            sums = sums + np.column_stack([pv.sum(axis=1), (pv ** 2).sum(axis=1)])
+        if (n == 0):
+            sums = np.zeros((len(PV_COLUMNS), 2))
+        return n, sums, year_sums
+
+    def summary(self, shards=None):
+        # mean and standard error of each PV (see runner.summarize) over the merged shards
+        n, sums, year_sums = self.merge(shards)
+        return summarize(n, sums)
+
+    def yearly(self, shards=None):
+        # average of every column in each year over the scenarios of the merged shards, one row per year
+        n, sums, year_sums = self.merge(shards)
+        table = {'Year': np.arange(year_sums.shape[1])}
+        for k, name in enumerate(self.columns):
+            table[COLUMN_HEADERS[name]] = year_sums[k] / max(n, 1)
+        return pd.DataFrame(table)
+
+if (__name__ == "__main__"):
+    parser = argparse.ArgumentParser(description="run the pending shards of a job, or merge its partial files")
+    parser.add_argument('directory')
+    parser.add_argument('--merge', action='store_true', help="print the merged results instead of running")
+    parser.add_argument('--stale-after', type=float, default=STALE_CLAIM_SECONDS,
+                        help="seconds after which an unrefreshed claim is taken over (0 runs every pending shard)")
+    args = parser.parse_args()
+
+    sharded = ShardedRun(args.directory)
+    if (args.merge):
+        print("%d of %d shards done" % (len(sharded.done()), len(sharded)))
+        print(sharded.summary())
+    else:
+        print("ran shards %s" % sharded.run(stale_after=args.stale_after))
@@ -0,0 +1,52 @@
+import copy
+
+import numpy as np
+
+from policy import Policy
+
+def net_rider_income(policy, fund2_return):
+    # mean pv_rc less mean pv_db_claim + pv_wb_claim of policy over the scenarios in fund2_return
+    pv_db_claim, pv_wb_claim, pv_rc = policy.calculate_batch(fund2_return)
+    return np.mean(pv_rc) - np.mean(pv_db_claim + pv_wb_claim)
+
+def breakeven_rider_charge(fund2_return, policy=None, lower=0.0, upper=0.05, tol=1e-8, max_iter=100):
+    # rider_charge_rate in [lower, upper] at which pv_rc covers pv_db_claim + pv_wb_claim on average
+    #
+    # every trial rate is valued on the same scenarios (common random numbers) by one calculate_batch
+    # on a copy of policy, reusing its cached schedule; the root is found by the Illinois variant of
+    # false position, which keeps the root bracketed
+    policy = copy.copy(Policy() if (policy is None) else policy)
+    fund2_return = np.asarray(fund2_return, dtype=float)
+
+    def net(rate):
+        policy.rider_charge_rate = rate
+        return net_rider_income(policy, fund2_return)
+
+    a, b = lower, upper
+    fa, fb = net(a), net(b)
+    if (fa == 0.0):
+        return a
+    if (fb == 0.0):
+        return b
+    if ((fa > 0.0) == (fb > 0.0)):
+        raise ValueError("the breakeven rider charge rate is not between %g and %g" % (lower, upper))
+
+    side = 0
+    c = a
+    for it in range(max_iter):
+        c_prev = c
+        c = (a * fb - b * fa) / (fb - fa)
+        fc = net(c)
+        if (fc == 0.0 or abs(c - c_prev) < tol or abs(b - a) < tol):
+            return c
+        if ((fc > 0.0) == (fb > 0.0)):
+            b, fb = c, fc
+            if (side == -1):
+                fa = fa / 2
+            side = -1
+        else:
+            a, fa = c, fc
+            if (side == 1):
+                fb = fb / 2
+            side = 1
+    raise RuntimeError("no breakeven rider charge rate within %g after %d iterations" % (tol, max_iter))
@@ -0,0 +1,83 @@
+import copy
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from inforce import PER_POLICY
+from policy import PV_COLUMNS, SCHEDULE_PARAMS, Policy
+from scenario import ScenarioGenerator, lognormal_returns
+
+PV_NAMES = [column for column, name in PV_COLUMNS]
+
+def grid_points(grid):
+    # the points of grid as a table, one row per point and one column per parameter:
+    # grid is a dict of parameter name -> values, swept over every combination, or a table of points
+    if (isinstance(grid, pd.DataFrame)):
+        points = grid.reset_index(drop=True)
+    else:
+        names = list(grid)
+        points = pd.DataFrame(list(itertools.product(*[grid[name] for name in names])), columns=names)
+    unknown = [name for name in points.columns if (name not in PER_POLICY)]
+    if (len(unknown) > 0):
+        raise ValueError("unknown grid parameters: %s" % ", ".join(unknown))
+    return points
+
+def _groups(points):
+    # positions of the points that share every schedule parameter of the grid, one array per group
+    schedule_names = [name for name in points.columns if (name in SCHEDULE_PARAMS)]
+    if (len(schedule_names) == 0):
+        return [np.arange(len(points))]
+    return list(points.groupby(schedule_names, sort=False).indices.values())
+
+def _group_pvs(policy, points, rows, z):
+    # PVs of the points at positions rows on shocks z, shape (len(rows), n_scenarios, len(PV_COLUMNS))
+    #
+    # every point runs on its own copy of the scenarios, row g * n_scenarios + k being scenario k of point g;
+    # schedule parameters are shared by the group, the others become per-row arrays
+    n = z.shape[0]
+    contract = copy.copy(policy)
+    for name in points.columns:
+        values = points[name].to_numpy()[rows]
+        if (name in SCHEDULE_PARAMS):
+            setattr(contract, name, values[0].item())
+        else:
+            setattr(contract, name, np.repeat(values.astype(float), n))
+    # returns are derived once for every volatility of the group and copied to the points that share it
+    point_volatility = np.broadcast_to(np.asarray(contract.volatility, dtype=float), (len(rows) * n,))[::n]
+    volatility, which = np.unique(point_volatility, return_inverse=True)
+    returns = lognormal_returns(z, contract.risk_free_rate, volatility[:, np.newaxis, np.newaxis])
+    results = contract.project_batch(returns[which].reshape(len(rows) * n, -1))
+    pv = np.column_stack([results[name] for column, name in PV_COLUMNS])
+    return pv.reshape(len(rows), n, len(PV_COLUMNS))
+
+def sweep(grid, n_scenarios, policy=None, generator=None, chunk_size=20000):
+    # Mean and Std_Error of pv_db_claim, pv_wb_claim and pv_rc at every point of grid (see grid_points),
+    # all valued on the same n_scenarios scenarios; one row per point, indexed by its parameters
+    #
+    # the points are an extra leading axis of the batch: points that share the schedule parameters
+    # (risk_free_rate, start_age, ...) run as one projection, with every other parameter as a per-row
+    # array, on contract copies, so policy and the Policy class are never modified; each point derives its
+    # fund2_return from the standard normal shocks of generator with its own risk_free_rate and volatility,
+    # as in greeks.py, and a projection holds at most about chunk_size rows
+    policy = Policy() if (policy is None) else policy
+    generator = ScenarioGenerator() if (generator is None) else generator
+    points = grid_points(grid)
+    groups = _groups(points)
+
+    step = max(1, chunk_size // max(len(rows) for rows in groups))
+    sums = np.zeros((len(points), len(PV_COLUMNS)))
+    squares = np.zeros((len(points), len(PV_COLUMNS)))
+    for lo in range(0, n_scenarios, step):
+        z = generator.normals(lo, min(lo + step, n_scenarios))
+        for rows in groups:
+            pv = _group_pvs(policy, points, rows, z)
+            sums[rows] += pv.sum(axis=1)
+            squares[rows] += (pv ** 2).sum(axis=1)
+
+    mean = sums / n_scenarios
+    var = np.maximum(squares - n_scenarios * mean ** 2, 0.0) / (n_scenarios - 1) if (n_scenarios > 1) else 0.0 * mean
+    index = pd.MultiIndex.from_frame(points)
+    return pd.concat({'Mean': pd.DataFrame(mean, index=index, columns=PV_NAMES),
+                      'Std_Error': pd.DataFrame(np.sqrt(var / n_scenarios), index=index, columns=PV_NAMES)},
+                     axis=1)
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+import reference_policy
+from policy import KERNEL_FIELDS, Policy
+
+# contracts the projections are checked on: the default one, an early withdrawal, a late start with
+# the annuity soon after it, and a higher rider charge on a younger contract
+CONTRACTS = [{},
+             {'start_age': 55, 'first_wd_age': 58},
+             {'start_age': 68, 'first_wd_age': 75, 'annuity_start_age': 78},
+             {'start_age': 50, 'rider_charge_rate': 0.012, 'wd_rate': 0.04}]
+
+def fund2_paths(n, seed=0, crashed=10):
+    # n lognormal fund2_return paths of the default Policy, the first crashed of them with returns 40%
+    # lower every year, so their account value runs out and the ruined-path tail is exercised
+    rng = np.random.default_rng(seed)
+    fund2_return = np.zeros((n, Policy.yrs))
+    fund2_return[:, 1:] = np.exp(np.log(1 + Policy.risk_free_rate) - 0.5 * Policy.volatility ** 2
+                                 + Policy.volatility * rng.standard_normal((n, Policy.yrs - 1))) - 1
+    fund2_return[:crashed, 1:] -= 0.4
+    return fund2_return
+
+def reference(params, fund2_return):
+    # the original scalar calculate of the contract of params on one path
+    policy = type('Contract', (reference_policy.Policy,), dict(params))()
+    policy.manually_input_fund2_return(fund2_return.copy())
+    policy.calculate()
+    return policy
+
+def contract(params):
+    return type('Contract', (Policy,), dict(params))()
+
+@pytest.mark.parametrize('params', CONTRACTS)
+def test_calculate_matches_reference(params):
+    # calculate gives the same PVs and per-year arrays as the original, bit for bit
+    for fund2_return in fund2_paths(30):
+        expected = reference(params, fund2_return)
+        policy = contract(params)
+        policy.manually_input_fund2_return(fund2_return)
+        policy.calculate()
+        for name in ['pv_db_claim', 'pv_wb_claim', 'pv_rc']:
+            assert getattr(policy, name) == getattr(expected, name), name
+        for name in KERNEL_FIELDS:
+            np.testing.assert_array_equal(getattr(policy, name), getattr(expected, name), err_msg=name)
+
+@pytest.mark.parametrize('params', CONTRACTS)
+def test_calculate_batch_matches_reference(params):
+    fund2_return = fund2_paths(200)
+    expected = [reference(params, path) for path in fund2_return]
+    pv = contract(params).calculate_batch(fund2_return)
+    for name, values in zip(['pv_db_claim', 'pv_wb_claim', 'pv_rc'], pv):
+        np.testing.assert_allclose(values, [getattr(policy, name) for policy in expected],
+                                   rtol=1e-12, atol=1e-9, err_msg=name)
+
+@pytest.mark.parametrize('params', CONTRACTS)
+def test_project_batch_matches_reference(params):
+    # with every per-year array kept, and with none (where ruined paths finish in closed form)
+    fund2_return = fund2_paths(200)
+    expected = [reference(params, path) for path in fund2_return]
+    for columns in [KERNEL_FIELDS, ()]:
+        results = contract(params).project_batch(fund2_return, columns)
+        for name in ['pv_db_claim', 'pv_wb_claim', 'pv_rc'] + list(columns):
+            np.testing.assert_allclose(results[name], [getattr(policy, name) for policy in expected],
+                                       rtol=1e-12, atol=1e-9, err_msg=name)
+
+def test_ruined_paths_are_exercised():
+    # the crashed paths of fund2_paths do run out of account value, so the closed-form tail is tested
+    results = Policy().project_batch(fund2_paths(200), ['av_post_death_claim'])
+    assert (results['av_post_death_claim'][:10, -1] == 0).all()
@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from inforce import InForce
+from policy import Policy
+from runner import MonteCarloRunner
+from scenario import ScenarioGenerator
+from shard import ShardedRun
+
+PARAMS = {'rider_charge_rate': 0.01, 'first_wd_age': 72}
+
+def runner_sums(n_scenarios, chunk_size, seed):
+    policy = type('Contract', (Policy,), PARAMS)()
+    runner = MonteCarloRunner(policy=policy, generator=ScenarioGenerator(seed=seed), chunk_size=chunk_size, max_workers=1)
+    return runner.run_sums(n_scenarios)
+
+def test_merge_equals_run_sums(tmp_path):
+    # shards of the size of the runner's chunks, each run in one batch and in any order, merge to the
+    # runner's sums bit for bit
+    job = ShardedRun.create(str(tmp_path / 'job'), 2500, 1000, params=PARAMS, generator=ScenarioGenerator(seed=7))
+    assert len(job) == 3
+    for shard in [2, 0, 1]:
+        job.run_shard(shard)
+    n, sums, year_sums = job.merge()
+    assert n == 2500
+    np.testing.assert_array_equal(sums, runner_sums(2500, 1000, 7))
+
+def test_merge_in_small_batches(tmp_path):
+    # shards run in batches smaller than a shard agree with the runner to rounding
+    job = ShardedRun.create(str(tmp_path / 'job'), 2500, 1000, params=PARAMS, generator=ScenarioGenerator(seed=7))
+    job.run(chunk_size=300)
+    np.testing.assert_allclose(job.merge()[1], runner_sums(2500, 1000, 7), rtol=1e-12)
+
+def test_rerun_after_crash(tmp_path):
+    # a rerun runs the shards without a partial file, including one left claimed by a crashed run
+    job = ShardedRun.create(str(tmp_path / 'job'), 300, 100, params=PARAMS, generator=ScenarioGenerator(seed=7))
+    assert job.run() == [0, 1, 2]
+    expected = job.merge()[1]
+    os.remove(job.partial_path(1))
+    assert job.claim(1) is not None
+    assert job.run() == [1]
+    assert job.pending() == []
+    np.testing.assert_array_equal(job.merge()[1], expected)
+
+def test_split_inforce_block(tmp_path):
+    # an in-force block split into policy shards merges to the sums over scenarios of the block's totals
+    rng = np.random.default_rng(0)
+    start_age = rng.integers(50, 70, 60)
+    inforce = InForce(pd.DataFrame({'start_age': start_age,
+                                    'first_wd_age': start_age + rng.integers(0, 10, 60),
+                                    'initial_premium': rng.uniform(5e4, 2e5, 60)}))
+    job = ShardedRun.create(str(tmp_path / 'job'), 200, 100, generator=ScenarioGenerator(seed=11),
+                            inforce=inforce, policy_shard_size=25)
+    assert len(job) == 6
+    job.run(chunk_size=1000)
+    n, sums, year_sums = job.merge()
+
+    fund2_return = ScenarioGenerator(seed=11).generate(200)
+    block = inforce.subset(np.tile(np.arange(60), 200))
+    results = block.project_batch(np.repeat(fund2_return, 60, axis=0))
+    totals = np.column_stack([results[name].reshape(200, 60).sum(axis=1) for name in ['pv_db_claim', 'pv_wb_claim', 'pv_rc']])
+    assert n == 200
+    np.testing.assert_allclose(sums, np.column_stack([totals.sum(axis=0), (totals ** 2).sum(axis=0)]), rtol=1e-12)
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+
+try:
+    import scipy.special
+    import scipy.stats.qmc
+except ImportError:
+    scipy = None
+
+from policy import PV_COLUMNS, Policy
+from scenario import ScenarioGenerator
+
+PV_NAMES = [column for column, name in PV_COLUMNS]
+SAMPLING = ['plain', 'antithetic', 'sobol']
+
+def discounted_fund2(fund2_return, risk_free_rate):
+    # average over years 1, ..., yrs - 1 of the fund2 unit value (1 at year 0) discounted at risk_free_rate;
+    # fund2 earns risk_free_rate on average, so its expectation is exactly 1
+    yrs = fund2_return.shape[1]
+    unit_value = np.cumprod(1 + fund2_return[:, 1:], axis=1)
+    return (unit_value * (1 + risk_free_rate) ** -np.arange(1, yrs)).mean(axis=1)
+
+def _normals(sampling, n_scenarios, generator, chunk_size, replicates):
+    # yields (unit, z) pairs: standard normal shocks z of up to chunk_size scenarios and the
+    # independent unit each scenario belongs to (the scenario, its antithetic pair or its Sobol replicate)
+    d = generator.yrs - 1
+    if (sampling == 'plain'):
+        for lo in range(0, n_scenarios, chunk_size):
+            hi = min(lo + chunk_size, n_scenarios)
+            yield np.arange(lo, hi), generator.normals(lo, hi)
+    elif (sampling == 'antithetic'):
+        half = max(1, chunk_size // 2)
+        for lo in range(0, n_scenarios // 2, half):
+            hi = min(lo + half, n_scenarios // 2)
+            z = generator.normals(lo, hi)
+            yield np.tile(np.arange(lo, hi), 2), np.vstack([z, -z])
+    else:
+        points = n_scenarios // replicates
+        # Sobol points keep their balance only when drawn in powers of 2, so chunks are the largest one
+        # within chunk_size; points is a power of 2 as well, so every chunk is whole
+        block = 1 << (max(chunk_size, 1).bit_length() - 1)
+        for r in range(replicates):
+            # each replicate is scrambled by its own stream, so the replicate means are independent
+            sobol = scipy.stats.qmc.Sobol(d, scramble=True, seed=generator.stream(r))
+            for lo in range(0, points, block):
+                u = sobol.random(min(block, points - lo))
+                yield np.full(len(u), r), scipy.special.ndtri(u)
+
+def estimate(n_scenarios, policy=None, generator=None, sampling='plain', control_variate=False,
+             chunk_size=10000, replicates=16):
+    # mean and standard error of pv_db_claim, pv_wb_claim and pv_rc over n_scenarios projections, with
+    # VR_Factor = (plain Monte Carlo variance of the mean for n_scenarios paths) / Std_Error ** 2,
+    # i.e. how many times more plain paths the same standard error would take
+    #
+    # sampling='antithetic' projects n_scenarios / 2 shock paths z together with -z;
+    # sampling='sobol' draws scrambled Sobol points over the yrs - 1 annual shocks in replicates
+    # independent randomizations of n_scenarios / replicates points (a power of 2), needs scipy;
+    # control_variate=True corrects the estimate by the paths' discounted_fund2, whose mean is known to be 1
+    policy = Policy() if (policy is None) else policy
+    generator = ScenarioGenerator() if (generator is None) else generator
+    if (sampling not in SAMPLING):
+        raise ValueError("sampling must be one of %s, not %r" % (", ".join(SAMPLING), sampling))
+    if (sampling == 'antithetic' and n_scenarios % 2 != 0):
+        raise ValueError("antithetic sampling needs an even number of scenarios, not %d" % n_scenarios)
+    if (sampling == 'sobol'):
+        if (scipy is None):
+            raise ImportError("sobol sampling needs scipy")
+        points = n_scenarios // replicates
+        if (n_scenarios % replicates != 0 or points & (points - 1) != 0):
+            raise ValueError("sobol sampling needs n_scenarios / replicates to be a power of 2, not %d / %d"
+                             % (n_scenarios, replicates))
+
+    units, pv, control = [], [], []
+    for unit, z in _normals(sampling, n_scenarios, generator, chunk_size, replicates):
+        fund2_return = generator.returns(z)
+        results = policy.project_batch(fund2_return)
+        units.append(unit)
+        pv.append(np.column_stack([results[name] for column, name in PV_COLUMNS]))
+        control.append(discounted_fund2(fund2_return, generator.risk_free_rate))
+    units, pv, control = np.concatenate(units), np.vstack(pv), np.concatenate(control)
+    plain_var = pv.var(axis=0, ddof=1) / n_scenarios
+
+    # the estimate is the mean of the independent units, each the average of its paths
+    count = np.bincount(units)
+    unit_mean = np.column_stack([np.bincount(units, weights=pv[:, k]) / count for k in range(pv.shape[1])])
+    if (control_variate):
+        # least-squares coefficient of each PV on the control, fitted across the units, as antithetic
+        # pairs and Sobol replicates already take out most of the control's path to path variation
+        unit_control = np.bincount(units, weights=control) / count
+        centred = unit_control - unit_control.mean()
+        beta = centred @ (unit_mean - unit_mean.mean(axis=0)) / (centred @ centred)
+        unit_mean = unit_mean - np.outer(unit_control - 1.0, beta)
+    mean = unit_mean.mean(axis=0)
+    var = unit_mean.var(axis=0, ddof=1) / len(unit_mean)
+    return pd.DataFrame({'Mean': mean,
+                         'Std_Error': np.sqrt(var),
+                         'VR_Factor': plain_var / var},
+                        index=PV_NAMES,
+                        columns=['Mean', 'Std_Error', 'VR_Factor'])